@@ -0,0 +1,150 @@
+import argparse
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from SearchEngine import SearchEngine, INDEX_DIR_NAME, MODELS
+from IndexStore import IndexStore
+from ScoreFusion import rank_scores
+from Evaluation import Evaluator
+from utils import TRECUtilities
+
+RUNS = MODELS + ("fused",)
+REPORTED_MEASURES = ("map", "P_5", "P_10", "ndcg_cut_10", "recall_100", "bpref")
+
+_worker_engine = None  # Engine of a worker process; inherited from the parent when processes are forked
+
+
+def init_worker(index_dir):
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = SearchEngine(clear_runs=False)
+        _worker_engine.load_index(IndexStore(index_dir))
+
+
+def run_queries(queries, runs, depth):
+    return search_queries(_worker_engine, queries, runs, depth)
+
+
+def search_queries(engine, queries, runs, depth):
+    """
+    Top results of a batch of queries for every requested run, as one run -> [{"doc_id", "score"}]
+    per query. Every model scores the whole batch with one matrix product, so the runs rank
+    documents like the per-query search path, with scores equal to within 1e-13 (not bit for bit).
+    """
+    scores = engine.score_queries(queries, MODELS if "fused" in runs else runs)
+    doc_ids = engine.tf_idf.documents.doc_ids
+
+    all_results = []
+    for row in range(len(queries)):
+        query_scores = {model: model_scores[row] for model, model_scores in scores.items()}
+        ranked = {run: (rank_scores(query_scores[run], depth), query_scores[run]) for run in runs if run in query_scores}
+        if "fused" in runs:
+            ranked["fused"] = engine.fuse(query_scores, depth)
+        all_results.append({run: [{"doc_id": doc_ids[idx], "score": float(run_scores[idx])} for idx in ranked_indices]
+                            for run, (ranked_indices, run_scores) in ranked.items()})
+    return all_results
+
+
+class BatchRunner:
+    def __init__(self, folder_path, runs=RUNS, workers=1, depth=100, chunks_per_worker=4):
+        """
+        Headless TREC batch evaluation: runs a whole query file against the saved index
+        and writes one run file per model.
+        :param folder_path: Indexed collection folder (the index is built first if it is missing or stale).
+        :param runs: Any of "vsm", "bm25", "lm" and "fused".
+        :param workers: Worker processes the queries are spread over (1 = in this process).
+        :param depth: Results written per query.
+        :param chunks_per_worker: Query chunks per worker, to balance uneven queries.
+        """
+        self.folder_path = folder_path
+        self.runs = tuple(run for run in RUNS if run in runs)
+        self.workers = workers
+        self.depth = depth
+        self.chunks_per_worker = chunks_per_worker
+        self.engine = None
+        self.queries = []
+        self.all_results = []
+
+    def load(self):
+        global _worker_engine
+        self.engine = SearchEngine(build_workers=self.workers, clear_runs=False)
+        self.engine.open_index(self.folder_path)
+        _worker_engine = self.engine  # Forked workers reuse the loaded index instead of loading their own
+
+    def search_all(self, queries):
+        """
+        Results of every query, in query order.
+        """
+        if self.workers <= 1 or len(queries) < 2:
+            return search_queries(self.engine, queries, self.runs, self.depth)
+
+        chunk_size = math.ceil(len(queries) / (self.workers * self.chunks_per_worker))
+        chunks = [queries[start:start + chunk_size] for start in range(0, len(queries), chunk_size)]
+        index_dir = os.path.join(self.folder_path, INDEX_DIR_NAME)
+        # Forked workers inherit the loaded engine; elsewhere init_worker loads the saved index
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=init_worker,
+                                 initargs=(index_dir,)) as executor:
+            return [results for chunk in executor.map(run_queries, chunks, [self.runs] * len(chunks),
+                                                      [self.depth] * len(chunks))
+                    for results in chunk]
+
+    def save_runs(self, queries, all_results):
+        for run in self.runs:
+            trec = TRECUtilities(f"{run}_results.trec", clear=False, depth=self.depth)
+            trec.save_run((query.query_id, results[run]) for query, results in zip(queries, all_results))
+
+    def run(self, query_file):
+        """
+        Run every query of a topics file and write the run files; returns queries per second.
+        """
+        self.queries = SearchEngine.load_queries(query_file)
+
+        start = time.perf_counter()
+        self.all_results = self.search_all(self.queries)
+        elapsed = time.perf_counter() - start
+
+        self.save_runs(self.queries, self.all_results)
+        return len(self.queries) / elapsed if elapsed > 0 else float("inf")
+
+    def evaluate(self, evaluator):
+        """
+        Evaluate the results of the last run in process, ranked as trec_eval ranks the run
+        files; returns run -> summary of every measure.
+        """
+        summaries = {}
+        for run in self.runs:
+            rankings = {str(query.query_id): Evaluator.trec_order((result["score"], result["doc_id"])
+                                                                  for result in results[run])
+                        for query, results in zip(self.queries, self.all_results)}
+            summaries[run] = evaluator.evaluate(rankings)[0]
+        return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a TREC query file against the saved index.")
+    parser.add_argument("folder", help="Collection folder (e.g. the Cranfield documents)")
+    parser.add_argument("--queries", help="Topics file (default: <folder>/cran.qry.xml)")
+    parser.add_argument("--runs", nargs="+", choices=RUNS, default=list(RUNS), help="Runs to produce")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (e.g. the number of cores)")
+    parser.add_argument("--depth", type=int, default=100, help="Results per query in the run files")
+    parser.add_argument("--qrels", help="Relevance judgements to evaluate the runs with (e.g. cranqrel)")
+    args = parser.parse_args()
+
+    runner = BatchRunner(args.folder, args.runs, args.workers, args.depth)
+    start = time.perf_counter()
+    runner.load()
+    print(f"Index loaded in {time.perf_counter() - start:.2f}s")
+
+    queries_per_second = runner.run(args.queries or os.path.join(args.folder, "cran.qry.xml"))
+    print(f"{queries_per_second:.1f} queries/sec; run files written for {', '.join(runner.runs)}")
+
+    if args.qrels:
+        for run, summary in runner.evaluate(Evaluator(args.qrels)).items():
+            print(run.ljust(6), "  ".join(f"{measure} {summary[measure]:.4f}" for measure in REPORTED_MEASURES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+import numpy as np
+
+RUNS = ("vsm", "bm25", "lm", "fused", "image")
+DOCS_PER_FILE = 10000  # Large corpora are split over several cran.all.* files
+STOP_WORDS = ("the", "of", "and", "a", "in", "to", "is", "for", "on", "with", "by", "at", "are", "as", "an", "be")
+
+# Measurements where a larger value is an improvement; every other measurement is better when smaller
+HIGHER_IS_BETTER = ("batch_queries_per_second",)
+
+
+def parse_size(text):
+    """
+    Parse a corpus size such as 1000, 10k or 1M.
+    """
+    multipliers = {"k": 1000, "m": 1000000}
+    text = text.strip().lower()
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def make_vocabulary(size, rng):
+    """
+    Distinct pronounceable pseudo-words, so every term is an ordinary alphabetic token.
+    """
+    syllables = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables, size=rng.integers(2, 5))))
+    return sorted(words)
+
+
+def generate_corpus(folder, num_docs, num_queries=225, vocabulary_size=20000, seed=0):
+    """
+    Write a synthetic collection shaped like Cranfield: cran.all.*.xml files with
+    docno/title/author/bib/text records (Zipfian vocabulary, stopwords and capitalised
+    names in multi-sentence abstracts) and a cran.qry.xml with queries drawn from
+    the documents' vocabulary. Files are written in chunks, so any size fits in memory.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    vocabulary = np.array(make_vocabulary(vocabulary_size, rng) + list(STOP_WORDS))
+    weights = 1 / np.arange(1, vocabulary_size + 1)
+    weights = np.concatenate([weights, np.full(len(STOP_WORDS), weights.sum() / 8 / len(STOP_WORDS))])
+    weights /= weights.sum()
+    names = [word.capitalize() for word in vocabulary[rng.choice(vocabulary_size, 200, replace=False)]]
+
+    def sentence(length):
+        words = list(vocabulary[rng.choice(len(vocabulary), size=length, p=weights)])
+        if rng.random() < 0.3:
+            words.insert(rng.integers(len(words) + 1), names[rng.integers(len(names))])
+        return " ".join(words)
+
+    for start in range(0, num_docs, DOCS_PER_FILE):
+        path = os.path.join(folder, f"cran.all.{start // DOCS_PER_FILE:04d}.xml")
+        with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+            for doc_id in range(start + 1, min(start + DOCS_PER_FILE, num_docs) + 1):
+                text = " . ".join(sentence(rng.integers(8, 26)) for _ in range(rng.integers(3, 9)))
+                f.write(f"<doc>\n<docno>\n{doc_id}\n</docno>\n<title>\n{sentence(rng.integers(5, 15))}\n</title>\n"
+                        f"<author>\n{names[rng.integers(len(names))].lower()}, a. b.\n</author>\n"
+                        f"<bib>\nj. ae. scs. {rng.integers(1, 30)}, {rng.integers(1940, 1970)}, "
+                        f"{rng.integers(1, 900)}.\n</bib>\n<text>\n{text} .\n</text>\n</doc>\n")
+
+    with open(os.path.join(folder, "cran.qry.xml"), "w", encoding="utf-8") as f:
+        f.write("<xml>\n")
+        for query_id in range(1, num_queries + 1):
+            f.write(f"<top>\n<num>{query_id}</num><title>\n{sentence(rng.integers(5, 16))} ?\n</title>\n</top>\n")
+        f.write("</xml>\n")
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024  # Bytes on macOS, KiB on Linux
+
+
+def folder_size_mb(folder):
+    total = 0
+    for directory, _, files in os.walk(folder):
+        total += sum(os.path.getsize(os.path.join(directory, file)) for file in files)
+    return total / (1 << 20)
+
+
+def latency_percentiles(search, texts, warmup=5):
+    """
+    p50/p95/p99 latency in milliseconds of search(text) over all query texts.
+    """
+    for text in texts[:warmup]:
+        search(text)
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        search(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def benchmark_image_search(documents, texts, k):
+    """
+    Build and query the ImageSearch BM25 path (rank_bm25 model + ImageIndex) on the same corpus.
+    """
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "ImageSearch"))
+    from rank_bm25 import BM25Okapi
+    from ImageIndex import ImageIndex
+
+    start = time.perf_counter()
+    corpus = [[word for word in doc.original_text.lower().split() if word.isalnum()] for doc in documents]
+    image_index = ImageIndex(BM25Okapi(corpus))
+    build_seconds = time.perf_counter() - start
+
+    def search(text):
+        scores = image_index.get_scores([word for word in text.lower().split() if word.isalnum()])
+        candidates = np.flatnonzero(scores)
+        return candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+
+    result = latency_percentiles(search, texts)
+    result["build_seconds"] = build_seconds
+    return result
+
+
+def benchmark_size(folder, num_docs, runs, k, workers):
+    """
+    Build the index of one generated corpus and measure it; runs in a fresh process
+    so the peak RSS belongs to this corpus only.
+    """
+    from SearchEngine import SearchEngine, INDEX_DIR_NAME
+    from ScoreFusion import rank_scores
+    from Query import Query
+
+    shutil.rmtree(os.path.join(folder, INDEX_DIR_NAME), ignore_errors=True)
+    engine = SearchEngine(build_workers=workers, clear_runs=False)
+    start = time.perf_counter()
+    engine.open_index(folder)
+    result = {
+        "documents": num_docs,
+        "build_seconds": time.perf_counter() - start,
+        "index_mb": folder_size_mb(os.path.join(folder, INDEX_DIR_NAME)),
+        "build_peak_rss_mb": peak_rss_mb(),
+    }
+
+    texts = [query.query_name for query in SearchEngine.load_queries(os.path.join(folder, "cran.qry.xml"))]
+    searches = {
+        "vsm": lambda text: rank_scores(engine.vsm.score_vector(Query(0, text)), k),
+        "bm25": lambda text: rank_scores(engine.bm25.score_vector(Query(0, text), k), k),
+        "lm": lambda text: rank_scores(engine.lm.score_vector(Query(0, text), smoothing="jm"), k),
+        "fused": lambda text: engine.fuse(engine.score_query(Query(0, text)), k),
+    }
+    for run in runs:
+        if run in searches:
+            result[run] = latency_percentiles(searches[run], texts)
+
+    if "fused" in runs:
+        start = time.perf_counter()
+        engine.score_queries([Query(i, text) for i, text in enumerate(texts)])
+        result["batch_queries_per_second"] = len(texts) / (time.perf_counter() - start)
+    if "image" in runs:
+        result["image"] = benchmark_image_search(engine.documents, texts, k)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_benchmarks(sizes, runs=RUNS, num_queries=225, k=100, workers=1, work_dir=None, seed=0):
+    """
+    Generate a corpus per size and benchmark it; returns the JSON-serialisable report.
+    """
+    work_dir = work_dir or tempfile.mkdtemp(prefix="search_benchmark_")
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {"queries": num_queries, "k": k, "workers": workers, "seed": seed},
+        "sizes": {},
+    }
+    for num_docs in sizes:
+        folder = os.path.join(work_dir, f"corpus_{num_docs}")
+        if not os.path.exists(os.path.join(folder, "cran.qry.xml")):
+            generate_corpus(folder, num_docs, num_queries, seed=seed)
+        # One fresh process per corpus size, started without inheriting this process' memory
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            report["sizes"][str(num_docs)] = executor.submit(benchmark_size, folder, num_docs, runs, k, workers).result()
+        print(f"{num_docs} documents: {json.dumps(report['sizes'][str(num_docs)])}")
+    return report
+
+
+def flatten(measurements, prefix=""):
+    flat = {}
+    for key, value in measurements.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and key != "documents":
+            flat[prefix + key] = value
+    return flat
+
+
+def compare_reports(report, baseline, tolerance=0.1):
+    """
+    Measurements of the report that are worse than the baseline by more than the tolerance
+    (a fraction), as (name, baseline value, current value) tuples.
+    """
+    regressions = []
+    for size, measurements in report["sizes"].items():
+        if size not in baseline["sizes"]:
+            continue
+        current, previous = flatten(measurements, f"{size}."), flatten(baseline["sizes"][size], f"{size}.")
+        for name in sorted(current.keys() & previous.keys()):
+            if name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER:
+                worse = current[name] < previous[name] * (1 - tolerance)
+            else:
+                worse = current[name] > previous[name] * (1 + tolerance)
+            if worse:
+                regressions.append((name, previous[name], current[name]))
+    return regressions
+
+
+# Main Program
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark index build and query latency on synthetic Cranfield-shaped corpora.")
+    parser.add_argument("--sizes", nargs="+", default=["1k", "10k"], help="Corpus sizes, e.g. 1k 10k 100k 1M")
+    parser.add_argument("--runs", nargs="+", choices=RUNS, default=list(RUNS))
+    parser.add_argument("--queries", type=int, default=225, help="Queries per corpus")
+    parser.add_argument("--k", type=int, default=100, help="Results per query")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes used to build the index")
+    parser.add_argument("--work-dir", help="Where corpora are generated (reused between runs)")
+    parser.add_argument("--output", default="benchmark.json", help="JSON report to write")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown before a regression is flagged")
+    parser.add_argument("--compare-only", action="store_true", help="Compare --output with --baseline without running")
+    args = parser.parse_args()
+
+    if args.compare_only:
+        with open(args.output, "r") as f:
+            report = json.load(f)
+    else:
+        report = run_benchmarks([parse_size(size) for size in args.sizes], args.runs, args.queries, args.k,
+                                args.workers, args.work_dir)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        for name, previous, current in regressions:
+            print(f"REGRESSION {name}: {previous:.4g} -> {current:.4g}")
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%} against {args.baseline}")
+        sys.exit(1 if regressions else 0)
@@ -1,65 +1,265 @@
 import json
 import math
+import heapq
+from bisect import bisect_left
 from collections import Counter
 from rank_bm25 import BM25Okapi,BM25L, BM25Plus
 from nltk.tokenize import word_tokenize
-import copy
 from utils import TRECUtilities
+from DocumentAnalyzer import DocumentAnalyzer
+from IndexStore import IndexStore
+from ScoreFusion import rank_scores
+from Instrumentation import instrumentation
+import numpy as np
+import scipy.sparse as sp
 from nltk.stem import PorterStemmer, WordNetLemmatizer
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 
 class BM25:
-    def __init__(self, tfidf_builder, trec=TRECUtilities( "bm25_results.trec"),k1=1.5, b=0.75 ):
+    def __init__(self, tfidf_builder, trec=None,k1=1.5, b=0.75 ):
         """
         Initialize the BM25 model.
         :param tfidf_builder: An instance of the TF_IDF_Builder class.
         :param k1: Term frequency saturation parameter.
         :param b: Length normalization parameter.
         :param preprocessor: Instance of Text preprocessor class
-        :param documents: List of documents
         """
         self.preprocessor = tfidf_builder.preprocessor
         self.tfidf_builder = tfidf_builder
 
         self.k1 = k1
         self.b = b
-        self.documents = []
-        self.trec = trec
+        # Created here, not as a default argument: TRECUtilities clears its run file, which must not happen on import
+        self.trec = TRECUtilities("bm25_results.trec") if trec is None else trec
 
         self.avg_doc_length = 0
-        self.doc_lengths = []
-        self.doc_frequencies = Counter()
+        self.doc_lengths = np.zeros(0, dtype=np.int64)
+        self.total_length = 0  # Sum of the document lengths
         self.total_documents = 0
+        self.postings = {}  # term -> ([doc indices], [term frequencies]), slices of the saved arrays after load
+        self.tokenized_corpus = []  # Tokens per document, None until needed after load
+        self.saved_tokens = None  # (terms, token_ptr, tokens) of the loaded index, to rebuild tokenized_corpus
+        self.max_scores = {}  # term -> upper bound of its score contribution
+        self.removed = set()  # Indices of removed documents
+        self.weight_matrix = None  # CSR terms x documents BM25 contributions, built on the first batch search
+        self.term_rows = {}  # term -> row of weight_matrix
         self.stop_words = set(stopwords.words('english'))
 
 
-    def build_index(self, documents):
+    def build_index(self, documents, analyses=None):
         """
         Build the BM25 index, calculating term frequencies and document lengths.
+        :param analyses: Shared DocumentAnalysis per document (computed here if not given).
         """
         if not documents:
             raise ValueError("No documents loaded. Use `load_documents()` first.")
 
-        self.documents = copy.deepcopy(documents.copy())
+        if analyses is None:
+            analyses = DocumentAnalyzer(self.preprocessor).analyze_all(documents)
 
-        for doc in self.documents:
-            doc.preprocessed_text = self.preprocess_bm25(doc)
-
-        self.tokenized_corpus = [doc.preprocessed_text.split() for doc in self.documents]
+        self.tokenized_corpus = [self.preprocess_bm25(analysis).split() for analysis in analyses]
+        self.saved_tokens = None
         #self.bm25 = BM25Okapi(self.tokenized_corpus)  # BM25 Okapi
         #self.bm25 = BM25L(self.tokenized_corpus)  # BM25L
         #self.bm25 = BM25Plus(self.tokenized_corpus)  # BM25+
 
-        self.total_documents = len(self.documents)
-        self.doc_lengths = [len(doc.preprocessed_text.split()) for doc in self.documents]
-        self.avg_doc_length = sum(self.doc_lengths) / self.total_documents
+        self.doc_lengths = np.array([len(tokens) for tokens in self.tokenized_corpus], dtype=np.int64)
+        self.total_length = int(self.doc_lengths.sum())
+        self.removed = set()
+
+        # Build the inverted index: term -> postings of (doc index, tf)
+        self.postings = {}
+        for doc_idx, tokens in enumerate(self.tokenized_corpus):
+            self.index_tokens(doc_idx, tokens)
+
+        self.update_statistics()
+
+    def index_tokens(self, doc_idx, tokens):
+        """
+        Append a document to the postings of its terms. Documents are indexed in
+        increasing index order, so every posting list stays sorted.
+        """
+        for term, tf in Counter(tokens).items():
+            doc_indices, tfs = self.editable_postings(term)
+            doc_indices.append(doc_idx)
+            tfs.append(tf)
+
+    def editable_postings(self, term):
+        """
+        Postings of a term as lists that can be changed. Postings loaded from a
+        saved index (read-only array slices) are copied on their first change.
+        """
+        postings = self.postings.get(term)
+        if postings is None:
+            postings = self.postings[term] = ([], [])
+        elif not isinstance(postings[0], list):
+            postings = self.postings[term] = (postings[0].tolist(), postings[1].tolist())
+        return postings
+
+    def corpus(self):
+        """
+        Tokens of every document (empty for removed documents). After load they
+        are rebuilt from the saved token ids on first use.
+        """
+        if self.tokenized_corpus is None:
+            terms, token_ptr, tokens = self.saved_tokens
+            token_ptr = token_ptr.tolist()
+            tokens = [terms[term_idx] for term_idx in tokens.tolist()]
+            self.tokenized_corpus = [[] if doc_idx in self.removed else tokens[token_ptr[doc_idx]:token_ptr[doc_idx + 1]]
+                                     for doc_idx in range(len(self.doc_lengths))]
+            self.saved_tokens = None
+        return self.tokenized_corpus
+
+    def document_tokens(self, doc_idx):
+        """
+        Tokens of one document, read from the saved index if the corpus was not rebuilt.
+        """
+        if self.tokenized_corpus is not None:
+            return self.tokenized_corpus[doc_idx]
+        terms, token_ptr, tokens = self.saved_tokens
+        return [terms[term_idx] for term_idx in tokens[token_ptr[doc_idx]:token_ptr[doc_idx + 1]].tolist()]
+
+    def update_statistics(self):
+        """
+        Update the collection-wide statistics (N, average length) after the set of
+        documents changed. IDF and length normalisation are derived from them when
+        scoring, so an update does not touch every term or document.
+        """
+        self.total_documents = len(self.doc_lengths) - len(self.removed)
+        self.avg_doc_length = self.total_length / max(self.total_documents, 1)
+
+        # Upper bounds and the batch weight matrix depend on the statistics above; recomputed lazily
+        self.max_scores = {}
+        self.weight_matrix = None
+
+    def idf(self, term):
+        """
+        BM25 idf of an indexed term.
+        """
+        df = len(self.postings[term][0])
+        return math.log((self.total_documents - df + 0.5) / (df + 0.5) + 1)
+
+    def doc_norms(self, doc_indices):
+        """
+        Length normalisation k1 * (1 - b + b * dl / avgdl) of a document or an array of documents.
+        """
+        return self.k1 * (1 - self.b + self.b * (self.doc_lengths[doc_indices] / self.avg_doc_length))
+
+    def term_contributions(self, term):
+        """
+        Score contribution of an indexed term to each document of its postings.
+        :return: (doc indices, contributions) arrays.
+        """
+        doc_indices, tfs = self.postings[term]
+        doc_indices, tfs = np.asarray(doc_indices, dtype=np.int64), np.asarray(tfs, dtype=np.int64)
+        return doc_indices, self.idf(term) * ((tfs * (self.k1 + 1)) / (tfs + self.doc_norms(doc_indices)))
+
+    def max_score(self, term):
+        """
+        Upper bound of the score contribution of a term, used for MaxScore pruning.
+        """
+        if term not in self.max_scores:
+            self.max_scores[term] = float(self.term_contributions(term)[1].max())
+        return self.max_scores[term]
+
+    def add_documents(self, documents, analyses=None):
+        """
+        Index new documents, appended after the existing ones (add them to the
+        TF-IDF builder's document store first). Only the postings of the new
+        documents' terms are touched.
+        :param analyses: Shared DocumentAnalysis per new document (computed here if not given).
+        """
+        if analyses is None:
+            analyses = DocumentAnalyzer(self.preprocessor).analyze_all(documents)
+
+        doc_lengths = []
+        for analysis in analyses:
+            doc_idx = len(self.doc_lengths) + len(doc_lengths)
+            tokens = self.preprocess_bm25(analysis).split()
+            self.corpus().append(tokens)
+            doc_lengths.append(len(tokens))
+            self.index_tokens(doc_idx, tokens)
+
+        self.doc_lengths = np.concatenate([self.doc_lengths, np.array(doc_lengths, dtype=np.int64)])
+        self.total_length += sum(doc_lengths)
+        self.update_statistics()
+
+    def remove_documents(self, doc_indices):
+        """
+        Remove documents from the index. Indices of the remaining documents do not change.
+        """
+        for doc_idx in doc_indices:
+            if doc_idx in self.removed:
+                continue
+            self.removed.add(doc_idx)
+
+            for term in set(self.document_tokens(doc_idx)):
+                term_doc_indices, tfs = self.editable_postings(term)
+                position = bisect_left(term_doc_indices, doc_idx)
+                del term_doc_indices[position]
+                del tfs[position]
+                if not term_doc_indices:
+                    del self.postings[term]
+
+            if self.tokenized_corpus is not None:
+                self.tokenized_corpus[doc_idx] = []
+            self.total_length -= int(self.doc_lengths[doc_idx])
+            self.doc_lengths[doc_idx] = 0
+
+        self.update_statistics()
+
+    def save(self, index_dir):
+        """
+        Save the inverted index as flat arrays: the postings of term i are
+        doc_indices[term_ptr[i]:term_ptr[i + 1]] with matching term frequencies.
+        """
+        store = IndexStore(index_dir)
+        terms = list(self.postings)
+        store.save_json("terms", terms)
+        store.save_array("term_ptr", np.cumsum([0] + [len(self.postings[term][0]) for term in terms]))
+        store.save_array("doc_indices", self.concatenate_postings(terms, 0))
+        store.save_array("tfs", self.concatenate_postings(terms, 1))
+        store.save_array("doc_lengths", self.doc_lengths)
+        store.save_array("removed", np.array(sorted(self.removed), dtype=np.int64))
+
+        # Token sequence of every document as term ids, needed to remove documents later
+        term_ids = {term: idx for idx, term in enumerate(terms)}
+        tokenized_corpus = self.corpus()
+        store.save_array("token_ptr", np.cumsum([0] + [len(tokens) for tokens in tokenized_corpus]))
+        store.save_array("tokens", np.array([term_ids[token] for tokens in tokenized_corpus for token in tokens],
+                                            dtype=np.int64))
+
+    def concatenate_postings(self, terms, column):
+        """
+        Doc indices (column 0) or term frequencies (column 1) of the postings of the terms, in order, as one array.
+        """
+        if not terms:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.asarray(self.postings[term][column], dtype=np.int64) for term in terms])
+
+    def load(self, index_dir):
+        """
+        Restore a saved BM25 index. The postings stay slices of the memory-mapped
+        arrays; the token lists are only rebuilt when documents are added.
+        """
+        store = IndexStore(index_dir)
+
+        terms = store.load_json("terms")
+        term_ptr = store.load_array("term_ptr").tolist()
+        doc_indices = store.load_array("doc_indices")
+        tfs = store.load_array("tfs")
+
+        self.postings = {term: (doc_indices[term_ptr[i]:term_ptr[i + 1]], tfs[term_ptr[i]:term_ptr[i + 1]])
+                         for i, term in enumerate(terms)}
 
-        # Calculate document frequencies for terms
-        for doc in self.documents:
-            unique_terms = set(doc.preprocessed_text.split())
-            for term in unique_terms:
-                self.doc_frequencies[term] += 1
+        self.doc_lengths = np.array(store.load_array("doc_lengths"), dtype=np.int64)  # Writable copy
+        self.total_length = int(self.doc_lengths.sum())
+        self.removed = set(store.load_array("removed").tolist())
+        self.update_statistics()
+
+        self.tokenized_corpus = None
+        self.saved_tokens = (terms, store.load_array("token_ptr"), store.load_array("tokens"))
 
     def compute_bm25_score(self, query_terms, doc_idx):
         """
@@ -68,31 +268,147 @@ class BM25:
         :param doc_idx: Index of the document in the loaded documents list.
         :return: BM25 score for the document.
         """
-        doc = self.documents[doc_idx]
-        doc_length = self.doc_lengths[doc_idx]
-        term_frequencies = Counter(doc.preprocessed_text.split())
-
         score = 0
+        doc_norm = float(self.doc_norms(doc_idx))
         for term in query_terms:
-            if term in self.doc_frequencies:
-                # BM25 components
-                df = self.doc_frequencies[term]
-                idf = math.log((self.total_documents - df + 0.5) / (df + 0.5) + 1)
-                tf = term_frequencies[term]
-                norm_tf = ((tf * (self.k1 + 1)) /
-                           (tf + self.k1 * (1 - self.b + self.b * (doc_length / self.avg_doc_length))))
-                score += idf * norm_tf
+            if term in self.postings:
+                # Term frequency from the sorted postings of the term (0 if absent)
+                doc_indices, tfs = self.postings[term]
+                position = bisect_left(doc_indices, doc_idx)
+                tf = tfs[position] if position < len(doc_indices) and doc_indices[position] == doc_idx else 0
+                score += self.idf(term) * ((tf * (self.k1 + 1)) / (tf + doc_norm))
 
         return score
-    
-    def preprocess_bm25(self, doc):
-        text = doc.original_text
 
-        tokens = word_tokenize(text.lower()) #Tokenisation
-        tokens = [word for word in tokens if word.isalnum() and word not in self.stop_words]  # Keep only alphabets and digits and remove stopwords
-        tokens = [self.preprocessor.lemmatizer.lemmatize(word) for word in tokens]  #Lemmatization
+    def compute_bm25_scores(self, query_terms):
+        """
+        Compute BM25 scores for every document matching at least one query term.
+        Only the postings of the query terms are visited.
+        :param query_terms: List of preprocessed query terms.
+        :return: Dictionary mapping document index to BM25 score.
+        """
+        scores = np.zeros(len(self.doc_lengths))
+        matched = np.zeros(len(self.doc_lengths), dtype=bool)
+        for term in query_terms:
+            if term not in self.postings:
+                continue
+            # Each document appears once per posting list, so the fancy-indexed add is exact
+            doc_indices, contributions = self.term_contributions(term)
+            scores[doc_indices] += contributions
+            matched[doc_indices] = True
+
+        doc_indices = np.flatnonzero(matched)
+        return dict(zip(doc_indices.tolist(), scores[doc_indices].tolist()))
+
+    def term_weights(self):
+        """
+        CSR matrix (terms x documents) of the BM25 contribution of every posting,
+        idf * tf * (k1 + 1) / (tf + norm), so a batch of queries is scored with one product.
+        """
+        if self.weight_matrix is None:
+            terms = list(self.postings)
+            self.term_rows = {term: row for row, term in enumerate(terms)}
+            term_ptr = np.cumsum([0] + [len(self.postings[term][0]) for term in terms])
+            doc_indices = self.concatenate_postings(terms, 0)
+            tfs = self.concatenate_postings(terms, 1).astype(np.float64)
+            # idf per term from the current statistics, computed only here for the whole vocabulary
+            idf = np.repeat(np.array([self.idf(term) for term in terms]), np.diff(term_ptr))
+            weights = idf * ((tfs * (self.k1 + 1)) / (tfs + self.doc_norms(doc_indices)))
+            self.weight_matrix = sp.csr_matrix((weights, doc_indices, term_ptr),
+                                               shape=(len(terms), len(self.doc_lengths)))
+        return self.weight_matrix
+
+    def compute_top_k(self, query_terms, k):
+        """
+        Retrieve the top-k documents using MaxScore dynamic pruning.
+        Documents whose score upper bound cannot beat the current k-th best score
+        are skipped without being fully scored. The returned scores and ordering
+        are identical to the exhaustive ranking.
+        :param query_terms: List of preprocessed query terms.
+        :param k: Number of documents to return.
+        :return: List of (doc index, score) tuples ranked by score.
+        """
+        query_counts = Counter(term for term in query_terms if term in self.postings)
+        if k <= 0 or not query_counts:
+            return []
+
+        # Sort terms by ascending upper bound; cumulative bounds decide which lists are essential
+        terms = sorted(query_counts, key=lambda t: query_counts[t] * self.max_score(t))
+        cumulative_bounds = []
+        total = 0
+        for term in terms:
+            total += query_counts[term] * self.max_score(term)
+            cumulative_bounds.append(total)
+
+        # Contributions of the query terms' postings, computed with array arithmetic up front
+        postings = [tuple(array.tolist() for array in self.term_contributions(term)) for term in terms]
+        cursors = [0] * len(terms)
+        heap = []  # min-heap of (score, -doc index)
+        threshold = 0  # Scores at or below the threshold cannot enter the top-k
+        first_essential = 0
+
+        while True:
+            # Next candidate is the smallest document in the essential posting lists
+            doc_idx = None
+            for i in range(first_essential, len(terms)):
+                doc_indices = postings[i][0]
+                if cursors[i] < len(doc_indices) and (doc_idx is None or doc_indices[cursors[i]] < doc_idx):
+                    doc_idx = doc_indices[cursors[i]]
+            if doc_idx is None:
+                break
+
+            contributions = {}
+            partial = 0
+            for i in range(first_essential, len(terms)):
+                doc_indices, term_contributions = postings[i]
+                if cursors[i] < len(doc_indices) and doc_indices[cursors[i]] == doc_idx:
+                    contribution = term_contributions[cursors[i]]
+                    cursors[i] += 1
+                    contributions[terms[i]] = contribution
+                    partial += query_counts[terms[i]] * contribution
+
+            # Probe non-essential lists from the largest bound down, stopping once hopeless
+            pruned = False
+            for i in range(first_essential - 1, -1, -1):
+                if partial + cumulative_bounds[i] <= threshold:
+                    pruned = True
+                    break
+                doc_indices, term_contributions = postings[i]
+                cursors[i] = bisect_left(doc_indices, doc_idx, cursors[i])
+                if cursors[i] < len(doc_indices) and doc_indices[cursors[i]] == doc_idx:
+                    contribution = term_contributions[cursors[i]]
+                    contributions[terms[i]] = contribution
+                    partial += query_counts[terms[i]] * contribution
+            if pruned:
+                continue
 
-        tokens.extend(self.preprocessor.extract_named_entities(text)) #Extract Named Entities
+            # Exact score, summed in query order exactly like compute_bm25_scores
+            score = 0
+            for term in query_terms:
+                if term in contributions:
+                    score += contributions[term]
+
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -doc_idx))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, -doc_idx))
+            else:
+                continue
+
+            if len(heap) == k:
+                # Small slack keeps pruning safe against floating point rounding of the bounds
+                threshold = heap[0][0] - 1e-9
+                while first_essential < len(terms) and cumulative_bounds[first_essential] <= threshold:
+                    first_essential += 1
+
+        return [(-neg_doc_idx, score) for score, neg_doc_idx in sorted(heap, key=lambda x: (-x[0], -x[1]))]
+    
+    def preprocess_bm25(self, analysis):
+        # Tokens and lemmas come from the shared analysis (alphanumeric tokens only)
+        tokens = [lemma for word, lemma in zip(analysis.words, analysis.lemmas)
+                  if word not in self.stop_words]  # Remove stopwords
+
+        tokens.extend(analysis.entities) #Extract Named Entities
 
         return " ".join(tokens)
     
@@ -100,68 +416,103 @@ class BM25:
 
         tokens = word_tokenize(text.lower())
         tokens = [word for word in tokens if word.isalnum()] # Keep only alphabets and digits and stopwords
-        tokens = [self.preprocessor.lemmatizer.lemmatize(word) for word in tokens]  # Lemmatization
+        tokens = [self.preprocessor.lemmatize(word) for word in tokens]  # Lemmatization
 
-        tokens.extend([self.preprocessor.synonym_expansion(word) for word in tokens])  # Synonym Expansion - Can improve query recall
+        with instrumentation.stage("bm25.synonym_expansion"):
+            tokens.extend([self.preprocessor.synonym_expansion(word) for word in tokens])  # Synonym Expansion - Can improve query recall
 
         return " ".join(tokens)
       
 
-    def search(self, query):
+    def score_vector(self, query, k=None):
         """
-        Search for the query in the document collection using BM25 scoring.
-        Returns ranked results with filename, filepath, similarity score, and snippet.
+        BM25 scores as an array aligned with the document indices, NaN for documents
+        without a positive score (not retrieved).
+        :param k: If given, only the top-k documents are scored using MaxScore pruning.
         """
-
-        processed_query = self.preprocess_query(query.query_name)
-        query_terms = processed_query.split()
+        with instrumentation.stage("bm25.preprocess"):
+            processed_query = self.preprocess_query(query.query_name)
+            query_terms = processed_query.split()
 
         #scores = self.bm25.get_scores(query_terms) #For rank_bm25 library
-        
-        scores = [(self.compute_bm25_score(query_terms, idx))
-                  for idx in range(len(self.documents))]
-        ranked_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
 
+        with instrumentation.stage("bm25.score"):
+            if k is None:
+                matches = self.compute_bm25_scores(query_terms).items()
+            else:
+                matches = self.compute_top_k(query_terms, k)
+
+            scores = np.full(len(self.doc_lengths), np.nan)
+            if matches:
+                doc_indices, doc_scores = zip(*matches)
+                scores[list(doc_indices)] = doc_scores
+            scores[scores <= 0] = np.nan  # Include only documents with non-zero scores
+        instrumentation.count("bm25.scored_documents", len(matches))
+        return scores
+
+    def score_matrix(self, queries):
+        """
+        BM25 scores of several queries at once (one row per query, as score_vector):
+        a sparse queries x terms count matrix times the terms x documents weight matrix.
+        """
+        weight_matrix = self.term_weights()
+        rows, cols = [], []
+        with instrumentation.stage("bm25.preprocess"):
+            for row, query in enumerate(queries):
+                for term in self.preprocess_query(query.query_name).split():
+                    if term in self.term_rows:
+                        rows.append(row)
+                        cols.append(self.term_rows[term])
+
+        with instrumentation.stage("bm25.score"):
+            # Duplicate (query, term) entries are summed: repeated query terms count repeatedly
+            query_matrix = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(queries), weight_matrix.shape[0]))
+            scores = (query_matrix @ weight_matrix).toarray()
+            scores[scores <= 0] = np.nan  # Include only documents with non-zero scores
+        return scores
+
+    def build_results(self, query, scores, k=None):
+        """
+        Ranked results (document index, doc id, score, snippet) from a score vector.
+        """
         #Result aggregation to save
+        with instrumentation.stage("bm25.sort"):
+            ranked_indices = rank_scores(scores, k)
+        instrumentation.count("bm25.results", len(ranked_indices))
+
         all_results = []
         for idx in ranked_indices:
-            if scores[idx] > 0:  # Include only documents with non-zero scores
-                doc = self.documents[idx]
-                snippet = self.generate_snippet(doc.original_text, query.query_name.split())
-                all_results.append({
-                    "doc_id": doc.doc_id,
-                    "file_name": doc.file_name,
-                    "original_text": doc.original_text,
-                    "path": doc.path,
-                    "score": scores[idx],
-                    "snippet": snippet,
-                    "extension": doc.file_extension,
-                    "bibliography": doc.bibliography,
-                    "author": doc.author
-                })
-
-        self.trec.save_to_trec(query, all_results)
-
+            snippet = self.tfidf_builder.snippets.lazy(idx, query.query_name.split())
+            all_results.append({
+                "doc_idx": int(idx),
+                "doc_id": self.tfidf_builder.documents.doc_ids[idx],
+                "score": float(scores[idx]),
+                "snippet": snippet
+            })
         return all_results
 
-    def generate_snippet(self, content, query_terms, snippet_length=30):
+    def results_from_scores(self, query, scores, k=None):
         """
-        Generate a snippet from the document containing the query terms,
-        with surrounding context and highlighted terms.
+        Ranked results from a score vector, saved to the TREC run.
         """
-        tokens = content.split()
-        query_terms_lower = [term.lower() for term in query_terms]
-        query_indices = [
-            i for i, token in enumerate(tokens)
-            if token.lower() in query_terms_lower
-        ]
+        all_results = self.build_results(query, scores, k)
+        with instrumentation.stage("bm25.save_to_trec"):
+            self.trec.save_to_trec(query, all_results)
+
+        return all_results
 
-        if not query_indices:
-            return "No relevant snippet found."
-        
-        # Generate snippet around the first matching term
-        start_index = max(0, query_indices[0] - snippet_length // 2)
-        end_index = min(len(tokens), query_indices[0] + snippet_length // 2)
+    def search(self, query, k=None):
+        """
+        Search for the query in the document collection using BM25 scoring.
+        Returns ranked results with document index, doc id, score, and snippet.
+        :param k: If given, only the top-k documents are retrieved using MaxScore pruning.
+        """
+        with instrumentation.trace("bm25.search", query.query_name):
+            return self.results_from_scores(query, self.score_vector(query, k), k)
 
-        snippet = " ".join(tokens[start_index:end_index])
-        return snippet + "..." if end_index < len(tokens) else snippet
\ No newline at end of file
+    def search_batch(self, queries, k=None):
+        """
+        Search for several queries at once; returns the results of each query, in order.
+        Nothing is saved to the TREC run (see BatchRunner for batch run files).
+        """
+        return [self.build_results(query, scores, k) for query, scores in zip(queries, self.score_matrix(queries))]
@@ -1,8 +1,12 @@
 from datetime import datetime
 
 class Document:
+    # No per-instance __dict__; collections are kept in a columnar DocumentStore
+    __slots__ = ("doc_id", "file_name", "path", "original_text", "preprocessed_text", "file_extension",
+                 "author", "bibliography", "sentences", "categories", "caption", "alt_text")
+
     def __init__(self, doc_id, file_name, path, original_text, preprocessed_text, file_extension,
-                 categories =[], caption ="", alt_text="",  author=None,
+                 categories=None, caption ="", alt_text="",  author=None,
                  bibliography=None):
         self.doc_id = doc_id
         self.file_name = file_name
@@ -13,6 +17,6 @@ class Document:
         self.author = author
         self.bibliography = bibliography
         self.sentences = []
-        self.categories = categories
+        self.categories = [] if categories is None else categories  # Not shared between documents
         self.caption = caption
         self.alt_text = alt_text
@@ -0,0 +1,93 @@
+import math
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from nltk.tokenize import word_tokenize
+
+# Immutable result of parsing a document once; all retrieval models build their index from it.
+#   words     -- lowercase alphanumeric word tokens
+#   lemmas    -- WordNet lemma of each word (aligned with words)
+#   entities  -- named entities found by spaCy in the original text
+#   sentences -- VSM sentence tokens (segmented, cleaned, POS-lemmatized)
+DocumentAnalysis = namedtuple("DocumentAnalysis", ["words", "lemmas", "entities", "sentences"])
+
+_worker_analyzer = None  # Analyzer of a worker process; inherited from the parent when processes are forked
+
+
+def init_worker(ner_batch_size):
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        from TextPreprocessor import TextPreprocessor  # Without fork, each worker loads its own NLP models
+        _worker_analyzer = DocumentAnalyzer(TextPreprocessor(), ner_batch_size)
+
+
+def analyze_shard(texts):
+    return _worker_analyzer.analyze_texts(texts)
+
+
+class DocumentAnalyzer:
+    def __init__(self, preprocessor, ner_batch_size=64, ner_processes=1, workers=1, shards_per_worker=4):
+        """
+        Single analysis stage shared by VSM, BM25 and LM.
+        :param preprocessor: Instance of Text preprocessor class
+        :param ner_batch_size: Batch size for spaCy NER over the collection.
+        :param ner_processes: Number of processes spaCy uses for NER.
+        :param workers: Number of worker processes analyzing shards of the collection (1 = in this process).
+        :param shards_per_worker: Contiguous shards per worker, to balance uneven documents.
+        """
+        self.preprocessor = preprocessor
+        self.ner_batch_size = ner_batch_size
+        self.ner_processes = ner_processes
+        self.workers = workers
+        self.shards_per_worker = shards_per_worker
+
+    def analyze(self, text, entities=None):
+        """
+        Run tokenization, lemmatization, sentence processing and NER on a text exactly once.
+        :param entities: Named entities of the text if already extracted in bulk.
+        """
+        lowered = self.preprocessor.case_insensitive(text)
+
+        words = [word for word in word_tokenize(lowered) if word.isalnum()]
+        lemmas = [self.preprocessor.lemmatize(word) for word in words]
+        if entities is None:
+            entities = self.preprocessor.extract_named_entities(text)
+
+        sentences = self.preprocessor.punkt_tokenize(lowered)  # Sentence segmentation
+        cleaned = self.preprocessor.clean_text(sentences, True)
+        sentences = self.preprocessor.lemmatization(cleaned)
+
+        return DocumentAnalysis(tuple(words), tuple(lemmas), tuple(entities),
+                                tuple(tuple(sentence) for sentence in sentences))
+
+    def analyze_all(self, documents):
+        """
+        Analyze every document, returning analyses aligned with the document list.
+        Named entities are extracted for the whole collection (or shard) in batches.
+        With several workers, contiguous shards are analyzed in a process pool and
+        concatenated in document order, so the result is identical to the serial run.
+        """
+        texts = [doc.original_text for doc in documents]
+        if self.workers <= 1 or len(texts) < 2:
+            return self.analyze_texts(texts)
+
+        global _worker_analyzer
+        shard_size = math.ceil(len(texts) / (self.workers * self.shards_per_worker))
+        shards = [texts[start:start + shard_size] for start in range(0, len(texts), shard_size)]
+        if "fork" in multiprocessing.get_all_start_methods():
+            # Forked workers share the already loaded NLP models copy-on-write instead of loading their own
+            context = multiprocessing.get_context("fork")
+            _worker_analyzer = DocumentAnalyzer(self.preprocessor, self.ner_batch_size)
+        else:
+            context = multiprocessing.get_context()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=init_worker,
+                                     initargs=(self.ner_batch_size,)) as executor:
+                return [analysis for shard in executor.map(analyze_shard, shards) for analysis in shard]
+        finally:
+            _worker_analyzer = None
+
+    def analyze_texts(self, texts):
+        entities = self.preprocessor.extract_named_entities_batch(texts, batch_size=self.ner_batch_size,
+                                                                  n_process=self.ner_processes)
+        return [self.analyze(text, doc_entities) for text, doc_entities in zip(texts, entities)]
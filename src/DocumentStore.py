@@ -0,0 +1,195 @@
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+import numpy as np
+from IndexStore import IndexStore
+
+
+class DocumentView:
+    """
+    Read-only view of one document in a DocumentStore, with the same attributes as Document.
+    """
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def doc_id(self):
+        return self.store.doc_ids[self.index]
+
+    @property
+    def file_name(self):
+        return self.store.titles[self.index]
+
+    @property
+    def path(self):
+        return self.store.paths[self.index]
+
+    @property
+    def file_extension(self):
+        return self.store.extensions[self.index]
+
+    @property
+    def author(self):
+        return self.store.authors[self.index]
+
+    @property
+    def bibliography(self):
+        return self.store.bibliographies[self.index]
+
+    @property
+    def original_text(self):
+        return self.store.text(self.index)
+
+    @property
+    def preprocessed_text(self):
+        return self.store.preprocessed_text(self.index)
+
+    @property
+    def sentences(self):
+        return []
+
+    def __repr__(self):
+        return f"DocumentView(index={self.index}, doc_id={self.doc_id!r})"
+
+
+class DocumentStore:
+    def __init__(self, documents=()):
+        """
+        Columnar store of a document collection. Metadata is kept in one list per field
+        (repeated values such as paths and authors are interned). All texts are appended
+        to a single UTF-8 file with an offset table and read back through mmap, so
+        resident memory does not grow with the size of the texts. Indexing returns a DocumentView.
+        :param documents: Initial Document objects.
+        """
+        self.doc_ids = []
+        self.titles = []
+        self.paths = []
+        self.extensions = []
+        self.authors = []
+        self.bibliographies = []
+        self.text_offsets = array("q", [0])  # Text of document i is bytes offsets[i]:offsets[i + 1] of the text file
+        self.preprocessed = {}  # Index -> preprocessed text, only where it differs from the text
+        self.text_file = tempfile.TemporaryFile()
+        self.text_path = None  # Set when the texts are read from a saved index
+        self.text_map = None
+        self.extend(documents)
+
+    def append(self, document):
+        """
+        Copy a Document (or view) into the store and return its index.
+        """
+        index = len(self.doc_ids)
+        self.doc_ids.append(document.doc_id)
+        self.titles.append(document.file_name)
+        self.paths.append(self.intern(document.path))
+        self.extensions.append(self.intern(document.file_extension))
+        self.authors.append(self.intern(document.author))
+        self.bibliographies.append(document.bibliography)
+
+        text = document.original_text
+        if self.text_path is not None:
+            self.detach()
+        self.text_file.seek(self.text_offsets[-1])
+        self.text_file.write(text.encode("utf-8"))
+        self.text_offsets.append(self.text_file.tell())
+        if document.preprocessed_text != text:
+            self.preprocessed[index] = document.preprocessed_text
+        return index
+
+    def extend(self, documents):
+        return [self.append(document) for document in documents]
+
+    def intern(self, value):
+        return sys.intern(value) if isinstance(value, str) else value
+
+    def detach(self):
+        """
+        Copy texts read from a saved index into a private file before appending,
+        so the saved index is never modified.
+        """
+        text_file = tempfile.TemporaryFile()
+        self.text_file.seek(0)
+        shutil.copyfileobj(self.text_file, text_file)
+        self.text_file.close()
+        self.text_file = text_file
+        self.text_path = None
+        self.text_map = None
+
+    def text(self, index):
+        start, end = self.text_offsets[index], self.text_offsets[index + 1]
+        if self.text_map is None or len(self.text_map) < end:
+            # (Re)map the file once it has grown past the mapped region
+            self.text_file.flush()
+            if end == 0:
+                return ""
+            self.text_map = mmap.mmap(self.text_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.text_map[start:end].decode("utf-8")
+
+    def preprocessed_text(self, index):
+        return self.preprocessed[index] if index in self.preprocessed else self.text(index)
+
+    def save(self, index_dir):
+        """
+        Save the metadata columns, the text offsets and the text file to an index directory.
+        """
+        store = IndexStore(index_dir)
+        store.save_json("documents", {
+            "doc_ids": self.doc_ids,
+            "titles": self.titles,
+            "paths": self.paths,
+            "extensions": self.extensions,
+            "authors": self.authors,
+            "bibliographies": self.bibliographies,
+            "preprocessed": {str(index): text for index, text in self.preprocessed.items()}
+        })
+        store.save_array("text_offsets", np.frombuffer(self.text_offsets, dtype=np.int64))
+
+        text_path = store.path("texts.bin")
+        if self.text_path is None or os.path.abspath(self.text_path) != os.path.abspath(text_path):
+            self.text_file.flush()
+            self.text_file.seek(0)
+            with open(text_path, "wb") as f:
+                shutil.copyfileobj(self.text_file, f)
+
+    @classmethod
+    def open(cls, index_dir):
+        """
+        Open a saved document store; texts stay on disk and are read through mmap.
+        """
+        store = IndexStore(index_dir)
+        documents = cls()
+        columns = store.load_json("documents")
+        documents.doc_ids = columns["doc_ids"]
+        documents.titles = columns["titles"]
+        documents.paths = [documents.intern(path) for path in columns["paths"]]
+        documents.extensions = [documents.intern(extension) for extension in columns["extensions"]]
+        documents.authors = [documents.intern(author) for author in columns["authors"]]
+        documents.bibliographies = columns["bibliographies"]
+        documents.preprocessed = {int(index): text for index, text in columns["preprocessed"].items()}
+        documents.text_offsets = array("q", store.load_array("text_offsets").tobytes())
+
+        documents.text_file.close()
+        documents.text_path = store.path("texts.bin")
+        documents.text_file = open(documents.text_path, "rb")
+        return documents
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [DocumentView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+        return DocumentView(self, index)
+
+    def __iter__(self):
+        return (DocumentView(self, index) for index in range(len(self)))
@@ -0,0 +1,135 @@
+import numpy as np
+
+CUTOFFS = (5, 10, 15, 20, 30, 100, 200, 500, 1000)  # Same cutoffs as trec_eval
+UNJUDGED = -1  # Retrieved document without a judgement
+NOT_RETRIEVED = -2  # Padding after the end of a shorter ranking
+
+
+class Evaluator:
+    def __init__(self, qrels_path="trec_eval-main/results_testing/cranqrel.test.txt", relevance_level=1,
+                 cutoffs=CUTOFFS):
+        """
+        In-process evaluation of ranked results with the trec_eval definitions of MAP,
+        P@k, recall@k, nDCG@k and bpref. The qrels are read once; every measure is
+        computed for all queries at once on a queries x ranks relevance matrix.
+        :param qrels_path: Relevance judgements in TREC format (query_id iter doc_id relevance).
+        :param relevance_level: Minimum judgement counted as relevant.
+        :param cutoffs: Rank cutoffs of P, recall and ndcg_cut.
+        """
+        self.relevance_level = relevance_level
+        self.cutoffs = cutoffs
+        self.qrels = self.load_qrels(qrels_path)
+
+    @staticmethod
+    def load_qrels(qrels_path):
+        """
+        Read a qrels file into query id -> {doc id: relevance}.
+        """
+        qrels = {}
+        with open(qrels_path, "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 4:
+                    query_id, _, doc_id, relevance = fields
+                    qrels.setdefault(query_id, {})[doc_id] = int(relevance)
+        return qrels
+
+    @staticmethod
+    def load_run(run_path):
+        """
+        Read a TREC run file into query id -> ranked doc ids, ordered like trec_eval
+        (by decreasing score, ties by decreasing doc id), not by the rank column.
+        """
+        entries = {}
+        with open(run_path, "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 6:
+                    query_id, _, doc_id, _, score, _ = fields
+                    entries.setdefault(query_id, []).append((float(score), doc_id))
+
+        return {query_id: Evaluator.trec_order(results) for query_id, results in entries.items()}
+
+    @staticmethod
+    def trec_order(results):
+        """
+        Doc ids of (score, doc id) pairs in trec_eval order: by decreasing score, ties by
+        decreasing doc id. Use it on in-memory results to get exactly the trec_eval values.
+        """
+        results = sorted(results, key=lambda result: str(result[1]), reverse=True)
+        results.sort(key=lambda result: result[0], reverse=True)  # Stable: keeps the doc id order on ties
+        return [doc_id for _, doc_id in results]
+
+    def relevance_matrix(self, query_ids, rankings):
+        """
+        Judgement of every retrieved document, one row per query (UNJUDGED for
+        documents without a judgement, NOT_RETRIEVED after the end of a ranking).
+        """
+        depth = max((len(ranking) for ranking in rankings), default=0)
+        relevance = np.full((len(query_ids), depth), NOT_RETRIEVED, dtype=np.int64)
+        for row, (query_id, ranking) in enumerate(zip(query_ids, rankings)):
+            judgements = self.qrels.get(str(query_id), {})
+            relevance[row, :len(ranking)] = [judgements.get(str(doc_id), UNJUDGED) for doc_id in ranking]
+        return relevance
+
+    def evaluate(self, run):
+        """
+        Evaluate a run given as query id -> ranked doc ids (e.g. from load_run, or doc ids of a
+        model's ranked results). Like trec_eval, only queries with judgements are evaluated.
+        :return: (mean of every measure over the queries, measure -> array of per-query values, query ids)
+        """
+        query_ids = [query_id for query_id in run if str(query_id) in self.qrels]
+        per_query = self.evaluate_rankings(query_ids, [run[query_id] for query_id in query_ids])
+        summary = {measure: float(values.mean()) if len(values) else 0.0 for measure, values in per_query.items()}
+        summary["num_rel_ret"] = int(per_query["num_rel_ret"].sum())  # Counts are totals, as in trec_eval
+        summary["num_q"] = len(query_ids)
+        return summary, per_query, query_ids
+
+    def evaluate_rankings(self, query_ids, rankings):
+        """
+        Per-query values of every measure for aligned lists of query ids and ranked doc ids.
+        """
+        relevance = self.relevance_matrix(query_ids, rankings)
+        judgements = [np.fromiter(self.qrels[str(query_id)].values(), dtype=np.int64) for query_id in query_ids]
+        num_rel = np.array([np.count_nonzero(judged >= self.relevance_level) for judged in judgements])
+        num_nonrel = np.array([np.count_nonzero((judged >= 0) & (judged < self.relevance_level))
+                               for judged in judgements])
+        safe_num_rel = np.maximum(num_rel, 1)
+
+        ranks = np.arange(1, relevance.shape[1] + 1)
+        relevant = relevance >= self.relevance_level
+        rel_so_far = np.cumsum(relevant, axis=1)
+
+        measures = {}
+        measures["num_rel_ret"] = rel_so_far[:, -1] if relevance.shape[1] else np.zeros(len(query_ids), dtype=np.int64)
+        measures["map"] = np.where(relevant, rel_so_far / ranks, 0).sum(axis=1) / safe_num_rel
+
+        # bpref: penalty for the judged non-relevant documents ranked above each relevant one
+        nonrel_so_far = np.cumsum((relevance >= 0) & (relevance < self.relevance_level), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            penalties = (np.minimum(nonrel_so_far, num_rel[:, None])
+                         / np.minimum(num_nonrel, num_rel)[:, None])
+        preferences = np.where(nonrel_so_far > 0, 1 - penalties, 1.0)
+        measures["bpref"] = np.where(relevant, preferences, 0).sum(axis=1) / safe_num_rel
+
+        # Discounted gains of the ranking and of the ideal ranking (judgements sorted by decreasing gain)
+        discounts = 1 / np.log2(ranks + 1)
+        dcg = np.cumsum(np.where(relevance > 0, relevance, 0) * discounts, axis=1)
+        ideal_depth = max(self.cutoffs)
+        ideal_gains = np.zeros((len(query_ids), ideal_depth))
+        for row, judged in enumerate(judgements):
+            gains = np.sort(judged[judged > 0])[::-1][:ideal_depth]
+            ideal_gains[row, :len(gains)] = gains
+        ideal_dcg = np.cumsum(ideal_gains / np.log2(np.arange(2, ideal_depth + 2)), axis=1)
+
+        for cutoff in self.cutoffs:
+            last = min(cutoff, relevance.shape[1]) - 1  # Rankings shorter than the cutoff keep their totals
+            rel_at_cutoff = rel_so_far[:, last] if last >= 0 else np.zeros(len(query_ids))
+            dcg_at_cutoff = dcg[:, last] if last >= 0 else np.zeros(len(query_ids))
+            ideal_at_cutoff = ideal_dcg[:, cutoff - 1]
+
+            measures[f"P_{cutoff}"] = rel_at_cutoff / cutoff
+            measures[f"recall_{cutoff}"] = rel_at_cutoff / safe_num_rel
+            measures[f"ndcg_cut_{cutoff}"] = np.divide(dcg_at_cutoff, ideal_at_cutoff,
+                                                       out=np.zeros(len(query_ids)), where=ideal_at_cutoff > 0)
+        return measures
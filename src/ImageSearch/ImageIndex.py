@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class ImageIndex:
+    def __init__(self, bm25):
+        """
+        Inverted index over a fitted rank_bm25 model.
+        :param bm25: A fitted rank_bm25 BM25Okapi instance (loaded from bm25_index.pkl).
+        """
+        self.bm25 = bm25
+        self.total_documents = len(bm25.doc_freqs)
+
+        # Same length normalisation as BM25Okapi.get_scores, computed once
+        doc_len = np.array(bm25.doc_len)
+        self.doc_norms = bm25.k1 * (1 - bm25.b + bm25.b * doc_len / bm25.avgdl)
+
+        # term -> (doc indices, term frequencies)
+        postings = {}
+        for doc_idx, frequencies in enumerate(bm25.doc_freqs):
+            for term, tf in frequencies.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(doc_idx)
+                postings[term][1].append(tf)
+        self.postings = {
+            term: (np.array(doc_indices, dtype=np.int64), np.array(tfs, dtype=np.float64))
+            for term, (doc_indices, tfs) in postings.items()
+        }
+
+    def get_scores(self, tokens):
+        """
+        BM25 scores for every image, identical to BM25Okapi.get_scores,
+        but only the postings of the query tokens are visited.
+        """
+        scores = np.zeros(self.total_documents)
+        k1 = self.bm25.k1
+        for token in tokens:
+            idf = self.bm25.idf.get(token)
+            if not idf or token not in self.postings:
+                continue
+            doc_indices, tfs = self.postings[token]
+            scores[doc_indices] += idf * (tfs * (k1 + 1) / (tfs + self.doc_norms[doc_indices]))
+        return scores
@@ -1,4 +1,8 @@
 import json
+import heapq
+import os
+import sys
+from functools import lru_cache
 from flask import Flask, request, render_template
 import pickle
 import nltk
@@ -9,6 +13,12 @@ import numpy as np
 import time
 from nltk.corpus import stopwords, wordnet
 import spacy
+from ImageIndex import ImageIndex
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from SynonymIndex import SynonymIndex  # Shared with the text search engine in src/
+from Instrumentation import instrumentation  # Per-stage timings, enable with SEARCH_INSTRUMENTATION=1
+from SearchLogger import SearchLogger
 
 nltk.download("punkt")  # Ensure tokenizer is available
 nltk.download('wordnet')
@@ -25,6 +35,11 @@ with open("bm25_index.pkl", "rb") as f:
 with open("image_url_to_text.pkl", "rb") as f:
     image_url_to_text = pickle.load(f)
 
+# Inverted index over the BM25 corpus so a query only touches its own postings
+image_index = ImageIndex(bm25)
+image_urls = list(image_url_to_text.keys())
+image_texts = list(image_url_to_text.values())
+
 # ✅ Load Object Detection Metadata (detected objects per image)
 with open("detected_objects_metadata.json", "r") as f:
     metadata = json.load(f)  # {image_url: [list of detected objects]}
@@ -33,6 +48,14 @@ RESULTS_PER_PAGE = 20  # Number of results per page
 SCORE_THRESHOLD = 0.25  # Minimum normalized BM25 score for inclusion
 BOOST_FACTOR = 3  # Boost multiplier for images with detected objects
 MAX_SYNONYMS = 3  # Maximum number of synonyms to fetch
+synonym_index = SynonymIndex(MAX_SYNONYMS).load_or_build(nlp)  # Built once, then memory-mapped
+
+if instrumentation.enabled:
+    # Export the trace of every /search_results request to the search log
+    search_logger = SearchLogger(time.strftime("ImageSearch_log_%Y-%m-%d_%H-%M-%S.jsonl"), console_output=False)
+    instrumentation.add_listener(search_logger.log_trace)
+
+@lru_cache(maxsize=50000)
 def get_wordnet_synonyms(word):
     """Fetch synonyms from WordNet."""
     synonyms = set()
@@ -43,16 +66,9 @@ def get_wordnet_synonyms(word):
 
 def get_spacy_synonyms(word):
     """Find semantically similar words using spaCy word vectors."""
-    word_token = str(word)
-    similar_words = []
-    for candidate in nlp.vocab:
-        if candidate.is_alpha and candidate.has_vector:  # Filter valid words
-            similarity = word_token.similarity(nlp(candidate.text))
-            if similarity > 0.6:  # Only include words with strong similarity
-                similar_words.append((candidate.text, similarity))
-    similar_words.sort(key=lambda x: x[1], reverse=True)
-    return [word[0] for word in similar_words[: MAX_SYNONYMS]]
+    return synonym_index.most_similar(str(word))
 
+@lru_cache(maxsize=50000)
 def synonym_expansion(word):
     """Expand words with synonyms using WordNet and spaCy."""
     synonyms = set()
@@ -96,51 +112,58 @@ def search_results():
     if not query:
         return render_template("results.html", results=[], query=query, page=page, total_pages=0, total_results=0)
 
-    lemmatizer = WordNetLemmatizer()
-    tokens = word_tokenize(query.lower())
-    tokens = [word for word in tokens if word.isalnum()]  # Remove non-alphanumeric characters
-    tokens = [lemmatizer.lemmatize(word) for word in tokens]  # Lemmatization
-    tokens.extend([synonym_expansion(word) for word in tokens])  # Synonym Expansion - Can improve query recall
+    with instrumentation.trace("image.search", query):
+        return rank_images(query, page, size_filter, color_filter, category_filter)
+
+def rank_images(query, page, size_filter, color_filter, category_filter):
+    """Score, boost, filter and paginate the images matching a non-empty query."""
+    with instrumentation.stage("image.preprocess"):
+        lemmatizer = WordNetLemmatizer()
+        tokens = word_tokenize(query.lower())
+        tokens = [word for word in tokens if word.isalnum()]  # Remove non-alphanumeric characters
+        tokens = [lemmatizer.lemmatize(word) for word in tokens]  # Lemmatization
+    with instrumentation.stage("image.synonym_expansion"):
+        tokens.extend([synonym_expansion(word) for word in tokens])  # Synonym Expansion - Can improve query recall
     print(tokens)
-    scores = bm25.get_scores(tokens)  # BM25 similarity scores
+    with instrumentation.stage("image.score"):
+        scores = image_index.get_scores(tokens)  # BM25 similarity scores
 
     # ✅ Normalize BM25 scores
-    min_score, max_score = min(scores), max(scores)
-    normalized_scores = [(s - min_score) / (max_score - min_score + 1e-9) for s in scores]  # Avoid division by zero
+    min_score, max_score = scores.min(), scores.max()
+    normalized_scores = (scores - min_score) / (max_score - min_score + 1e-9)  # Avoid division by zero
     results = []
 
-    if all(score == 0 for score in scores):
+    if not scores.any():
         return render_template("results.html", results=[], query=query, page=page, total_pages=0, total_results=0)
 
-    for i, (image_url, text) in enumerate(image_url_to_text.items()):
-        score = scores[i]
-        norm_score = normalized_scores[i]  # Use normalized score
-        # ✅ Apply BM25 cut-off threshold
-        if norm_score >= SCORE_THRESHOLD:
-            final_score = norm_score  # Base score
-            
-            # ✅ Boost score if detected objects match query
-            metadata_for_image = metadata.get(image_url, {})
-            metadata_list = metadata_for_image.get("detected_objects", [])  # Access the "objects" key
-            # Check how many tokens match detected objects and apply proportional boost
-            matching_tokens = sum(1 for token in tokens if token in metadata_list)
-            if matching_tokens > 0:
-                 final_score *= (BOOST_FACTOR * matching_tokens)  # Apply boost proportional to matches
-
-            # ✅ Add metadata to results
-            results.append({
-                "image_url": image_url,  
-                "description": text,
-                "image_size": metadata_for_image.get("image_size", [0, 0]),  # Use default size if not available
-                "dominant_colors": get_color_name(metadata_for_image.get("dominant_colors", [])),  # Use default color if not available
-                "color_rgb": metadata_for_image.get("dominant_colors", [0, 0, 0]),  # Use default color if not available
-                "score": final_score,  # Use boosted score if applicable
-                "detected_objects": metadata_for_image.get("detected_objects", []),  # Use default empty list if not available
-                "categories": metadata_for_image.get("categories", []),  # Use default empty list if not available
-                "caption": metadata_for_image.get("caption", ""),  # Use default empty string if not available
-                "alt_text": metadata_for_image.get("alt_text", ""),  # Use default empty string if not available
-                "page_title": metadata_for_image.get("page_title", "")  # Use default empty string if not available
-            })
+    # ✅ Apply BM25 cut-off threshold, only images above it are visited
+    for i in np.flatnonzero(normalized_scores >= SCORE_THRESHOLD):
+        image_url, text = image_urls[i], image_texts[i]
+        norm_score = float(normalized_scores[i])  # Use normalized score
+        final_score = norm_score  # Base score
+        
+        # ✅ Boost score if detected objects match query
+        metadata_for_image = metadata.get(image_url, {})
+        metadata_list = metadata_for_image.get("detected_objects", [])  # Access the "objects" key
+        # Check how many tokens match detected objects and apply proportional boost
+        matching_tokens = sum(1 for token in tokens if token in metadata_list)
+        if matching_tokens > 0:
+             final_score *= (BOOST_FACTOR * matching_tokens)  # Apply boost proportional to matches
+
+        # ✅ Add metadata to results
+        results.append({
+            "image_url": image_url,  
+            "description": text,
+            "image_size": metadata_for_image.get("image_size", [0, 0]),  # Use default size if not available
+            "dominant_colors": get_color_name(metadata_for_image.get("dominant_colors", [])),  # Use default color if not available
+            "color_rgb": metadata_for_image.get("dominant_colors", [0, 0, 0]),  # Use default color if not available
+            "score": final_score,  # Use boosted score if applicable
+            "detected_objects": metadata_for_image.get("detected_objects", []),  # Use default empty list if not available
+            "categories": metadata_for_image.get("categories", []),  # Use default empty list if not available
+            "caption": metadata_for_image.get("caption", ""),  # Use default empty string if not available
+            "alt_text": metadata_for_image.get("alt_text", ""),  # Use default empty string if not available
+            "page_title": metadata_for_image.get("page_title", "")  # Use default empty string if not available
+        })
 
     # ✅ Filter results based on size and color
     filtered_results = []
@@ -179,15 +202,15 @@ def search_results():
         # Append the result if it passes all filters
         filtered_results.append(result)
 
-    # ✅ Sort results by final score (highest first)
-    filtered_results.sort(key=lambda x: x["score"], reverse=True)
     total_results = len(filtered_results)
     total_pages = (total_results // RESULTS_PER_PAGE) + (1 if total_results % RESULTS_PER_PAGE else 0)
 
-    # Paginate results
+    # ✅ Paginate results, only the top results up to the requested page are ranked (highest first)
     start = (page - 1) * RESULTS_PER_PAGE
     end = start + RESULTS_PER_PAGE
-    paginated_results = filtered_results[start:end]
+    with instrumentation.stage("image.sort"):
+        paginated_results = heapq.nlargest(end, filtered_results, key=lambda x: x["score"])[start:end]
+    instrumentation.count("image.results", total_results)
 
     # Extract unique categories
     available_categories = set()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import numpy as np
+import scipy.sparse as sp
+
+FORMAT_VERSION = 4  # Bump whenever the layout of a saved model changes
+
+
+class StringArray:
+    def __init__(self, buffer, offsets, path=None):
+        """
+        Read-only list of strings stored as one UTF-8 buffer and an offset table;
+        each string is decoded only when it is accessed.
+        :param buffer: uint8 array (usually memory-mapped) holding the encoded strings.
+        :param offsets: String i is bytes offsets[i]:offsets[i + 1] of the buffer.
+        :param path: File the buffer is mapped from, if any.
+        """
+        self.buffer = buffer
+        self.offsets = offsets
+        self.path = path
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string index out of range")
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class IndexStore:
+    def __init__(self, index_dir):
+        """
+        Versioned on-disk index directory. Arrays are stored as .npy files and
+        loaded memory-mapped; metadata is stored as JSON. The manifest is written
+        last, so an interrupted save is never mistaken for a valid index.
+        :param index_dir: Directory holding the saved index.
+        """
+        self.index_dir = index_dir
+
+    def path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def save_array(self, name, array):
+        os.makedirs(self.index_dir, exist_ok=True)
+        np.save(self.path(name + ".npy"), np.asarray(array))
+
+    def load_array(self, name):
+        return np.load(self.path(name + ".npy"), mmap_mode="r")
+
+    def save_csr(self, name, matrix):
+        """
+        Store a CSR matrix as its data/indices/indptr arrays and shape.
+        """
+        matrix = sp.csr_matrix(matrix)
+        self.save_array(name + ".data", matrix.data)
+        self.save_array(name + ".indices", matrix.indices)
+        self.save_array(name + ".indptr", matrix.indptr)
+        self.save_array(name + ".shape", np.array(matrix.shape, dtype=np.int64))
+
+    def load_csr(self, name):
+        shape = tuple(int(n) for n in self.load_array(name + ".shape"))
+        return sp.csr_matrix((self.load_array(name + ".data"), self.load_array(name + ".indices"),
+                              self.load_array(name + ".indptr")), shape=shape, copy=False)
+
+    def save_strings(self, name, strings):
+        """
+        Store a list of strings as one UTF-8 buffer (name.bin) and its offsets (name.offsets.npy).
+        """
+        text_path = self.path(name + ".bin")
+        if isinstance(strings, StringArray) and strings.path is not None \
+                and os.path.abspath(strings.path) == os.path.abspath(text_path):
+            return  # Already saved here, and the mapped file must not be overwritten
+        encoded = [string.encode("utf-8") for string in strings]
+        self.save_array(name + ".offsets", np.cumsum([0] + [len(data) for data in encoded], dtype=np.int64))
+        with open(text_path, "wb") as f:
+            f.write(b"".join(encoded))
+
+    def load_strings(self, name):
+        """
+        Open strings saved by save_strings; the buffer is memory-mapped, not decoded.
+        """
+        offsets = self.load_array(name + ".offsets")
+        text_path = self.path(name + ".bin")
+        if offsets[-1] == 0:
+            return StringArray(np.zeros(0, dtype=np.uint8), offsets)  # An empty file cannot be mapped
+        return StringArray(np.memmap(text_path, dtype=np.uint8, mode="r"), offsets, text_path)
+
+    def save_json(self, name, obj):
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self.path(name + ".json"), "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+
+    def load_json(self, name):
+        with open(self.path(name + ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def subdir(self, name):
+        """
+        Store for one component (e.g. a retrieval model) inside this index.
+        """
+        return IndexStore(self.path(name))
+
+    def write_manifest(self, checksum):
+        self.save_json("manifest", {"format_version": FORMAT_VERSION, "checksum": checksum})
+
+    def invalidate(self):
+        """
+        Remove the manifest before overwriting an index in place.
+        """
+        if os.path.exists(self.path("manifest.json")):
+            os.remove(self.path("manifest.json"))
+
+    def is_current(self, checksum):
+        """
+        True if a complete index of the current format exists for the given content checksum.
+        """
+        if not os.path.exists(self.path("manifest.json")):
+            return False
+        manifest = self.load_json("manifest")
+        return manifest.get("format_version") == FORMAT_VERSION and manifest.get("checksum") == checksum
+
+    @staticmethod
+    def folder_checksum(folder_path, prefix="cran.all"):
+        """
+        SHA-256 over the names and contents of the collection files in a folder.
+        """
+        digest = hashlib.sha256()
+        for file in sorted(os.listdir(folder_path)):
+            file_path = os.path.join(folder_path, file)
+            if os.path.isfile(file_path) and file.startswith(prefix):
+                digest.update(file.encode())
+                with open(file_path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+        return digest.hexdigest()
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+
+class NullStage:
+    """
+    Shared no-op context manager returned while instrumentation is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    __slots__ = ("instrumentation", "name", "start")
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Trace:
+    __slots__ = ("instrumentation", "name", "query", "started", "start", "total_ns", "stages", "counters")
+
+    def __init__(self, instrumentation, name, query):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.query = query
+        self.stages = {}  # stage -> nanoseconds (summed if a stage runs more than once)
+        self.counters = {}
+
+    def __enter__(self):
+        self.instrumentation.local.trace = self
+        self.started = time.time()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.total_ns = time.perf_counter_ns() - self.start
+        self.instrumentation.local.trace = None
+        self.instrumentation.finish(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "query": self.query,
+            "started": self.started,
+            "total_ns": self.total_ns,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+        }
+
+
+class Instrumentation:
+    def __init__(self, enabled=False, window=1000, max_traces=100):
+        """
+        Per-stage timings (nanoseconds) and counters of the search paths.
+        A trace covers one query; stages inside it are timed and counted into the
+        trace and into a rolling window per stage for percentiles. Stages may nest,
+        so a stage's time includes the stages inside it. While disabled every hook
+        returns a shared no-op context manager.
+        :param enabled: Start recording immediately.
+        :param window: Most recent durations kept per stage for the rolling histograms.
+        :param max_traces: Most recent finished traces kept for export.
+        """
+        self.enabled = enabled
+        self.window = window
+        self.local = threading.local()  # Active trace of each thread
+        self.lock = threading.Lock()
+        self.durations = {}  # stage or trace name -> deque of recent durations in ns
+        self.counters = {}
+        self.traces = deque(maxlen=max_traces)
+        self.listeners = []  # Called with every finished trace
+
+    def trace(self, name, query=None):
+        """
+        Time one query. Inside an active trace (e.g. a model search called by SearchApp)
+        this is an ordinary stage of the outer trace.
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        if getattr(self.local, "trace", None) is not None:
+            return Stage(self, name)
+        return Trace(self, name, query)
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        trace = getattr(self.local, "trace", None)
+        if trace is not None:
+            trace.counters[name] = trace.counters.get(name, 0) + value
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name, duration_ns):
+        trace = getattr(self.local, "trace", None)
+        if trace is not None:
+            trace.stages[name] = trace.stages.get(name, 0) + duration_ns
+        with self.lock:
+            if name not in self.durations:
+                self.durations[name] = deque(maxlen=self.window)
+            self.durations[name].append(duration_ns)
+
+    def finish(self, trace):
+        self.record(trace.name, trace.total_ns)
+        self.traces.append(trace)
+        for listener in self.listeners:
+            listener(trace)
+
+    def add_listener(self, listener):
+        """
+        Call listener(trace) whenever a trace finishes (e.g. SearchLogger.log_trace).
+        """
+        self.listeners.append(listener)
+
+    def export_traces(self):
+        return [trace.to_dict() for trace in list(self.traces)]
+
+    def histograms(self):
+        """
+        Rolling latency summary per stage over the recent window, in milliseconds.
+        """
+        with self.lock:
+            durations = {name: np.array(window, dtype=np.float64) for name, window in self.durations.items()}
+        summary = {}
+        for name, values in durations.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) / 1e6
+            summary[name] = {"count": len(values), "mean_ms": float(values.mean() / 1e6),
+                             "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+        return summary
+
+    def reset(self):
+        with self.lock:
+            self.durations = {}
+            self.counters = {}
+            self.traces.clear()
+
+
+# Shared by every search path; enable with SEARCH_INSTRUMENTATION=1 or instrumentation.enabled = True
+instrumentation = Instrumentation(enabled=os.environ.get("SEARCH_INSTRUMENTATION") == "1")
@@ -0,0 +1,117 @@
+import json
+import os
+import numpy as np
+
+
+class InteractionStore:
+    def __init__(self, log_path="interaction_log.jsonl", snapshot_path="interaction_data.json",
+                 boost_per_view=0.1, max_boost=1.0, compact_after=1000):
+        """
+        Document views per query, kept in memory as query -> doc id -> views and score boost.
+        Every view is appended to a JSON Lines log (O(1) I/O per click); the log is periodically
+        compacted into the snapshot. Views carry a sequence number so a view already in the
+        snapshot is never replayed twice, even if compaction was interrupted.
+        :param log_path: Append-only log of views since the last compaction.
+        :param snapshot_path: Compacted interactions (older files without sequence numbers are read as-is).
+        :param boost_per_view: Score boost added per view of a document for a query.
+        :param max_boost: Upper bound of the boost of one document for one query.
+        :param compact_after: Views appended to the log before it is compacted.
+        """
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.boost_per_view = boost_per_view
+        self.max_boost = max_boost
+        self.compact_after = compact_after
+        self.interactions = {}  # query -> doc id -> {"views", "score_boost"}
+        self.sequence = 0  # Sequence number of the last view
+        self.logged_views = 0  # Views in the log since the last compaction
+        self.log_file = None
+        self.load()
+
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(query.lower().split())
+
+    def load(self):
+        snapshot_sequence = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            if "interactions" in snapshot and "sequence" in snapshot:
+                self.interactions, snapshot_sequence = snapshot["interactions"], snapshot["sequence"]
+            else:
+                self.interactions = snapshot  # Written before the log existed: query -> doc id -> entry
+        self.sequence = snapshot_sequence
+
+        # Replay the views logged after the snapshot
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r") as f:
+                for line in f:
+                    try:
+                        view = json.loads(line)
+                    except ValueError:
+                        continue  # Partly written last line
+                    if view["seq"] > snapshot_sequence:
+                        self.apply_view(view["query"], view["doc_id"])
+                        self.logged_views += 1
+                    self.sequence = max(self.sequence, view["seq"])
+
+    def apply_view(self, query, doc_id):
+        entry = self.interactions.setdefault(query, {}).setdefault(doc_id, {"views": 0, "score_boost": 0.0})
+        entry["views"] += 1
+        entry["score_boost"] = min(entry["score_boost"] + self.boost_per_view, self.max_boost)
+
+    def record_view(self, query, doc_id):
+        """
+        Record that a document was viewed for a query: one appended log line.
+        """
+        query, doc_id = self.normalize_query(query), str(doc_id)
+        self.sequence += 1
+        if self.log_file is None:
+            self.log_file = open(self.log_path, "a", encoding="utf-8")
+        self.log_file.write(json.dumps({"seq": self.sequence, "query": query, "doc_id": doc_id}) + "\n")
+        self.log_file.flush()
+
+        self.apply_view(query, doc_id)
+        self.logged_views += 1
+        if self.logged_views >= self.compact_after:
+            self.compact()
+
+    def compact(self):
+        """
+        Write every interaction to the snapshot (atomically) and start an empty log.
+        """
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"sequence": self.sequence, "interactions": self.interactions}, f)
+        os.replace(temp_path, self.snapshot_path)
+
+        if self.log_file is not None:
+            self.log_file.close()
+        self.log_file = open(self.log_path, "w", encoding="utf-8")  # Views up to self.sequence are in the snapshot
+        self.logged_views = 0
+
+    def boosts(self, query):
+        """
+        Doc id -> score boost of the documents viewed for a query.
+        """
+        return {doc_id: entry["score_boost"] for doc_id, entry in
+                self.interactions.get(self.normalize_query(query), {}).items()}
+
+    def boost_vector(self, query, doc_index):
+        """
+        Sparse boost of a query as (document indices, boosts) for ScoreFusion.fuse.
+        :param doc_index: Doc id -> document index; documents no longer indexed are skipped.
+        """
+        boosts = [(doc_index[doc_id], boost) for doc_id, boost in self.boosts(query).items() if doc_id in doc_index]
+        if not boosts:
+            return None
+        indices, values = zip(*boosts)
+        return np.array(indices, dtype=np.int64), np.array(values, dtype=np.float64)
+
+    def close(self):
+        if self.logged_views:
+            self.compact()
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
@@ -2,15 +2,21 @@ import math
 from collections import Counter
 from nltk.tokenize import word_tokenize
 from TextPreprocessor import TextPreprocessor
-import copy
+from DocumentAnalyzer import DocumentAnalyzer
+from IndexStore import IndexStore
+from ScoreFusion import rank_scores
+from Instrumentation import instrumentation
+import numpy as np
+import scipy.sparse as sp
 
 class MultinomialLanguageModel:
-    def __init__(self, tfidf_builder, trec, mu=2000, lambda_unk=0.0001, lambda_jm=0.1):
+    def __init__(self, tfidf_builder, trec, mu=2000, lambda_unk=0.0001, lambda_jm=0.1, consolidate_ratio=0.1):
         """
         Initialize the Language Model for Information Retrieval.
         :param tfidf_builder: An instance of the TF_IDF_Builder class.
         :param mu: Dirichlet smoothing parameter.
         :param lambda_unk: Probability mass for unknown words.
+        :param consolidate_ratio: Added postings, as a fraction of the matrix size, kept outside the matrix before it is rebuilt.
         """
         self.preprocessor = tfidf_builder.preprocessor
         self.tfidf_builder = tfidf_builder
@@ -20,23 +26,23 @@ class MultinomialLanguageModel:
         self.lambda_unk = lambda_unk  # Smoothing for unknown words
         self.lambda_jm = lambda_jm  # Jelinek-Mercer lambda
 
-        self.documents = []
-
         self.total_terms = 0
-        self.term_frequencies = Counter()
-        self.doc_lengths = []
-        self.doc_frequencies = {}  # Changed to a dictionary of dictionaries
-        self.collection_probability = {}  # P(w|C)
-        self.probabilities = {}  # Map of word probabilities
+        self.vocabulary = {}  # term -> row index in term_doc_matrix
+        self.term_doc_matrix = None  # CSR matrix (terms x documents) of term counts
+        self.term_frequencies = None  # Collection frequency per term
+        self.doc_lengths = None
+        self.collection_probability = None  # P(w|C) per term
+        self.correction_matrices = {}  # smoothing -> posting_corrections matrix, built on the first batch search
 
-    def preprocess_lm(self, doc):
-        text = doc.original_text
+        self.consolidate_ratio = consolidate_ratio
+        self.active = None  # False for removed documents
+        self.pending_postings = {}  # term index -> ([doc indices], [counts]) added since the matrix was built
+        self.pending_count = 0
 
-        tokens = word_tokenize(text.lower())
-        tokens = [word for word in tokens if word.isalnum()]  # Keep stopwords  
-        tokens = [self.preprocessor.lemmatizer.lemmatize(word) for word in tokens]  # Preserve word forms  
+    def preprocess_lm(self, analysis):
+        tokens = list(analysis.lemmas)  # Keep stopwords, preserve word forms
 
-        tokens.extend(self.preprocessor.extract_named_entities(text))  # Keep named entities for context  
+        tokens.extend(analysis.entities)  # Keep named entities for context  
 
         return " ".join(tokens)
     
@@ -44,39 +50,142 @@ class MultinomialLanguageModel:
         
         tokens = word_tokenize(text.lower())
         tokens = [word for word in tokens if word.isalnum()]  # Keep stopwords  
-        tokens = [self.preprocessor.lemmatizer.lemmatize(word) for word in tokens]  # Preserve word forms  
+        tokens = [self.preprocessor.lemmatize(word) for word in tokens]  # Preserve word forms  
         
         return " ".join(tokens)
 
-    def build_index(self, documents):
+    def build_index(self, documents, analyses=None):
         """
         Build the Language Model index by computing document term frequencies and collection probabilities.
+        :param analyses: Shared DocumentAnalysis per document (computed here if not given).
         """
         if not documents:
             raise ValueError("No documents loaded. Use `load_documents()` first.")
 
-        self.documents = copy.deepcopy(documents)
-        for doc in self.documents:
-            doc.preprocessed_text = self.preprocess_lm(doc)
-
-        self.total_terms = sum(len(doc.preprocessed_text.split()) for doc in self.documents)
-        self.doc_lengths = [len(doc.preprocessed_text.split()) for doc in self.documents]
-
-        # Initialize the document frequencies
-        for doc in self.documents:
-            self.doc_frequencies[doc.doc_id] = Counter()  # Initialize empty Counter for each document
-            tokens = doc.preprocessed_text.split()
-            for term in tokens:
-                self.doc_frequencies[doc.doc_id][term] += 1
-                self.term_frequencies[term] += 1
-
+        if analyses is None:
+            analyses = DocumentAnalyzer(self.preprocessor).analyze_all(documents)
+
+        # Term-document count matrix, one row of postings per term
+        self.vocabulary = {}
+        rows, cols, counts = [], [], []
+        for doc_idx, analysis in enumerate(analyses):
+            for term, tf in Counter(self.preprocess_lm(analysis).split()).items():
+                rows.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                cols.append(doc_idx)
+                counts.append(tf)
+
+        self.term_doc_matrix = sp.csr_matrix((np.array(counts, dtype=np.float64), (rows, cols)),
+                                             shape=(len(self.vocabulary), len(analyses)))
+        self.doc_lengths = np.asarray(self.term_doc_matrix.sum(axis=0)).ravel()
+        self.term_frequencies = np.asarray(self.term_doc_matrix.sum(axis=1)).ravel()
+        self.active = np.ones(len(analyses), dtype=bool)
+        self.pending_postings = {}
+        self.pending_count = 0
+        self.update_collection_probability()
+
+    def update_collection_probability(self):
         # Compute collection probability P(w|C)
-        self.collection_probability = {
-            term: self.term_frequencies[term] / self.total_terms for term in self.term_frequencies
-        }
+        self.total_terms = self.term_frequencies.sum()
+        self.collection_probability = self.term_frequencies / self.total_terms
+        self.correction_matrices = {}  # Depend on the collection statistics; rebuilt lazily
+
+    def add_documents(self, documents, analyses=None):
+        """
+        Add new documents after the existing ones (add them to the TF-IDF builder's
+        document store first). Their postings are kept next to the term-document
+        matrix until they grow past consolidate_ratio of it.
+        :param analyses: Shared DocumentAnalysis per new document (computed here if not given).
+        """
+        if analyses is None:
+            analyses = DocumentAnalyzer(self.preprocessor).analyze_all(documents)
+
+        doc_lengths = []
+        term_counts = Counter()
+        for doc_idx, analysis in enumerate(analyses, start=len(self.doc_lengths)):
+            counts = Counter(self.preprocess_lm(analysis).split())
+            for term, tf in counts.items():
+                term_idx = self.vocabulary.setdefault(term, len(self.vocabulary))
+                doc_indices, tfs = self.pending_postings.setdefault(term_idx, ([], []))
+                doc_indices.append(doc_idx)
+                tfs.append(float(tf))
+                term_counts[term_idx] += tf
+            doc_lengths.append(sum(counts.values()))
+            self.pending_count += len(counts)
+
+        self.doc_lengths = np.concatenate([self.doc_lengths, np.array(doc_lengths, dtype=np.float64)])
+        self.active = np.concatenate([self.active, np.ones(len(doc_lengths), dtype=bool)])
+        self.term_frequencies = np.concatenate([self.term_frequencies,
+                                                np.zeros(len(self.vocabulary) - len(self.term_frequencies))])
+        for term_idx, count in term_counts.items():
+            self.term_frequencies[term_idx] += count
+        self.update_collection_probability()
+
+        if self.pending_count > self.consolidate_ratio * self.term_doc_matrix.nnz:
+            self.consolidate()
+
+    def remove_documents(self, doc_indices):
+        """
+        Remove documents from the collection statistics and the rankings.
+        Indices of the remaining documents do not change.
+        """
+        doc_indices = [doc_idx for doc_idx in set(doc_indices) if self.active[doc_idx]]
+        if not doc_indices:
+            return
+        if any(doc_idx >= self.term_doc_matrix.shape[1] for doc_idx in doc_indices):
+            self.consolidate()  # Removed documents must be columns of the matrix
+
+        removed = self.term_doc_matrix[:, doc_indices]  # Counts of the removed documents
+        self.term_frequencies -= np.asarray(removed.sum(axis=1)).ravel()
+        self.doc_lengths[doc_indices] = 0
+        self.active[doc_indices] = False
+        self.update_collection_probability()
+
+    def consolidate(self):
+        """
+        Merge the pending postings into the term-document matrix and drop removed documents' counts.
+        """
+        matrix = self.term_doc_matrix.tocoo()
+        rows, cols, counts = [matrix.row], [matrix.col], [matrix.data]
+        for term_idx, (doc_indices, tfs) in self.pending_postings.items():
+            rows.append(np.full(len(doc_indices), term_idx))
+            cols.append(np.array(doc_indices))
+            counts.append(np.array(tfs))
+        rows, cols, counts = np.concatenate(rows), np.concatenate(cols), np.concatenate(counts)
+
+        keep = self.active[cols]
+        self.term_doc_matrix = sp.csr_matrix((counts[keep], (rows[keep], cols[keep])),
+                                             shape=(len(self.vocabulary), len(self.doc_lengths)))
+        self.pending_postings = {}
+        self.pending_count = 0
+        self.correction_matrices = {}
+
+    def save(self, index_dir):
+        """
+        Save the vocabulary and term-document count matrix.
+        """
+        if self.pending_postings:
+            self.consolidate()
+        store = IndexStore(index_dir)
+        store.save_json("vocabulary", sorted(self.vocabulary, key=self.vocabulary.get))
+        store.save_csr("term_doc_matrix", self.term_doc_matrix)
+        store.save_array("doc_lengths", self.doc_lengths)
+        store.save_array("term_frequencies", self.term_frequencies)
+        store.save_array("active", self.active)
+
+    def load(self, index_dir):
+        """
+        Restore a saved Language Model index.
+        """
+        store = IndexStore(index_dir)
 
-        # Store probabilities in a map (like the model file in the pseudocode)
-        self.probabilities = self.collection_probability.copy()
+        self.vocabulary = {term: idx for idx, term in enumerate(store.load_json("vocabulary"))}
+        self.term_doc_matrix = store.load_csr("term_doc_matrix")
+        self.doc_lengths = np.array(store.load_array("doc_lengths"))  # Small and updated in place
+        self.term_frequencies = np.array(store.load_array("term_frequencies"))
+        self.active = np.array(store.load_array("active"))
+        self.pending_postings = {}
+        self.pending_count = 0
+        self.update_collection_probability()
 
     def compute_lm_entropy_and_coverage(self, query):
         """
@@ -89,9 +198,9 @@ class MultinomialLanguageModel:
         unk_count = 0  # Unknown word count
 
         for word in words:
-            P = self.lambda_unk / len(self.probabilities)  # Default probability for unknown words
-            if word in self.probabilities:
-                P += (1 - self.lambda_unk) * self.probabilities[word]  # Apply known word probability
+            P = self.lambda_unk / len(self.vocabulary)  # Default probability for unknown words
+            if self.term_index(word) is not None:
+                P += (1 - self.lambda_unk) * self.collection_probability[self.vocabulary[word]]  # Apply known word probability
             else:
                 unk_count += 1  # Word was not found in probabilities
 
@@ -102,109 +211,222 @@ class MultinomialLanguageModel:
 
         return entropy, coverage
 
-    def search(self, query, smoothing="dirichlet"):
+    def score_vector(self, query, smoothing="dirichlet"):
         """
-        Search for the query in the document collection using the Language Model.
-        Returns ranked results with filename, filepath, similarity score, and snippet.
+        Language Model scores as an array aligned with the document indices, NaN for removed documents.
         """
-        if not self.probabilities:
+        if self.term_doc_matrix is None:
             raise ValueError("Language Model index not built. Load documents and build the index first.")
 
-        processed_query = self.preprocess_query(query.query_name)
+        with instrumentation.stage("lm.preprocess"):
+            processed_query = self.preprocess_query(query.query_name)
         entropy, coverage = self.compute_lm_entropy_and_coverage(processed_query)
 
-        scores = [(idx, self.compute_lm_score(processed_query, idx,smoothing=smoothing)) for idx in range(len(self.tfidf_builder.documents))]
-        scores = sorted(scores, key=lambda x: x[1], reverse=True)
+        with instrumentation.stage("lm.score"):
+            scores = self.compute_lm_scores(processed_query, smoothing=smoothing)
+            scores[~self.active] = np.nan  # Skip removed documents
+        return scores
+
+    def score_matrix(self, queries, smoothing="dirichlet"):
+        """
+        Language Model scores of several queries at once (one row per query, as score_vector).
+        The sparse queries x terms count matrix is multiplied with the per-posting smoothing
+        corrections of the term-document matrix; the shared background is added per query.
+        """
+        if self.term_doc_matrix is None:
+            raise ValueError("Language Model index not built. Load documents and build the index first.")
+        if smoothing not in ("dirichlet", "jm"):
+            raise ValueError("Invalid smoothing method. Choose 'dirichlet' or 'jm'.")
+        if self.pending_postings:
+            self.consolidate()  # Every posting must be in the matrix
+
+        rows, cols = [], []
+        backgrounds = np.zeros(len(queries))
+        query_lengths = np.zeros(len(queries))
+        with instrumentation.stage("lm.preprocess"):
+            for row, query in enumerate(queries):
+                query_terms = word_tokenize(self.preprocess_query(query.query_name).lower())
+                query_lengths[row] = len(query_terms)
+                for term in query_terms:
+                    term_idx = self.term_index(term)
+                    backgrounds[row] += self.background_log_probability(term_idx, smoothing)
+                    if term_idx is not None:
+                        rows.append(row)
+                        cols.append(term_idx)
+
+        with instrumentation.stage("lm.score"):
+            # Duplicate (query, term) entries are summed: repeated query terms count repeatedly
+            query_matrix = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(queries), len(self.vocabulary)))
+            scores = (query_matrix @ self.posting_corrections(smoothing)).toarray() + backgrounds[:, None]
+            if smoothing == "dirichlet":
+                scores -= query_lengths[:, None] * np.log(self.doc_lengths + self.mu)
+            scores[:, ~self.active] = np.nan  # Skip removed documents
+        return scores
+
+    def background_log_probability(self, term_idx, smoothing):
+        """
+        Log-probability shared by every document for one query term (None for unknown terms).
+        """
+        if smoothing == "dirichlet":
+            collection_prob = self.lambda_unk / len(self.vocabulary) if term_idx is None else self.collection_probability[term_idx]
+            return math.log(self.mu * collection_prob)
+        collection_prob = 0 if term_idx is None else self.collection_probability[term_idx]
+        return math.log(max(self.lambda_jm * collection_prob, 1e-10))
+
+    def posting_corrections(self, smoothing):
+        """
+        CSR matrix (terms x documents) of the score correction of every posting over the background,
+        the same sparse corrections compute_dirichlet_scores and compute_jm_scores add per term.
+        Cached per smoothing until the collection changes.
+        """
+        if smoothing in self.correction_matrices:
+            return self.correction_matrices[smoothing]
+        matrix = self.term_doc_matrix
+        term_rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        collection_prob = self.collection_probability[term_rows]
+        if smoothing == "dirichlet":
+            with np.errstate(divide="ignore"):
+                corrections = np.log1p(matrix.data / (self.mu * collection_prob))
+        else:
+            background_prob = np.maximum(self.lambda_jm * collection_prob, 1e-10)
+            term_probability = ((1 - self.lambda_jm) * (matrix.data / (self.doc_lengths[matrix.indices] + 1e-10))
+                                + self.lambda_jm * collection_prob)
+            corrections = np.log(np.maximum(term_probability, 1e-10)) - np.log(background_prob)
+        self.correction_matrices[smoothing] = sp.csr_matrix((corrections, matrix.indices, matrix.indptr), shape=matrix.shape)
+        return self.correction_matrices[smoothing]
+
+    def build_results(self, query, scores, k=None):
+        """
+        Ranked results (document index, doc id, score, snippet) from a score vector.
+        """
+        with instrumentation.stage("lm.sort"):
+            ranked_indices = rank_scores(scores, k)
+        instrumentation.count("lm.results", len(ranked_indices))
 
         all_results = []
-        for idx, score in scores:
-            doc = self.documents[idx]
-            snippet = self.generate_snippet(doc.original_text, query.query_name.split())
+        for idx in ranked_indices:
+            score = float(scores[idx])
+            snippet = self.tfidf_builder.snippets.lazy(idx, query.query_name.split())
             all_results.append({
-                "doc_id": doc.doc_id,
-                "file_name": doc.file_name,
-                "path": doc.path,
-                "original_text": doc.original_text,
+                "doc_idx": int(idx),
+                "doc_id": self.tfidf_builder.documents.doc_ids[idx],
                 "score": score,
-                "snippet": snippet,
-                "extension": doc.file_extension,
-                "bibliography": doc.bibliography,
-                "author": doc.author
+                "snippet": snippet
             })
+        return all_results
 
-        self.trec.save_to_trec(query, all_results)
+    def results_from_scores(self, query, scores, k=None):
+        """
+        Ranked results from a score vector, saved to the TREC run.
+        """
+        all_results = self.build_results(query, scores, k)
+        with instrumentation.stage("lm.save_to_trec"):
+            self.trec.save_to_trec(query, all_results)
         return all_results
+
+    def search(self, query, smoothing="dirichlet", k=None):
+        """
+        Search for the query in the document collection using the Language Model.
+        Returns ranked results with document index, doc id, score, and snippet.
+        :param k: Number of documents to return (None returns every document).
+        """
+        with instrumentation.trace("lm.search", query.query_name):
+            return self.results_from_scores(query, self.score_vector(query, smoothing), k)
+
+    def search_batch(self, queries, k=None, smoothing="dirichlet"):
+        """
+        Search for several queries at once; returns the results of each query, in order.
+        Nothing is saved to the TREC run (see BatchRunner for batch run files).
+        """
+        return [self.build_results(query, scores, k)
+                for query, scores in zip(queries, self.score_matrix(queries, smoothing))]
     
-    def compute_lm_score(self, query, doc_idx, smoothing="dirichlet"):
+    def compute_lm_scores(self, query, smoothing="dirichlet"):
         """
-        Compute the Language Model score for a given query and document index.
+        Compute the Language Model scores of all documents for a given query.
         Supports Dirichlet and Jelinek-Mercer smoothing.
 
         :param query: The preprocessed query text.
-        :param doc_idx: The index of the document.
         :param smoothing: "dirichlet" for Dirichlet smoothing, "jm" for Jelinek-Mercer smoothing.
+        :return: NumPy array with one score per document.
         """
+        query_terms = word_tokenize(query.lower())
         if smoothing == "dirichlet":
-            return self.compute_dirichlet_score(query, doc_idx)
+            return self.compute_dirichlet_scores(query_terms)
         elif smoothing == "jm":
-            return self.compute_jm_score(query, doc_idx)
+            return self.compute_jm_scores(query_terms)
         else:
             raise ValueError("Invalid smoothing method. Choose 'dirichlet' or 'jm'.")
 
-    def compute_dirichlet_score(self, query, doc_idx):
+    def term_index(self, term):
         """
-        Compute the Language Model score using Dirichlet smoothing.
+        Row of a term in the index, or None if it no longer occurs in any document.
         """
-        query_terms = word_tokenize(query.lower())
-        score = 0
-        doc_id = self.documents[doc_idx].doc_id
+        term_idx = self.vocabulary.get(term)
+        if term_idx is not None and self.term_frequencies[term_idx] == 0:
+            return None
+        return term_idx
 
-        for term in query_terms:
-            doc_term_freq = self.doc_frequencies.get(doc_id, {}).get(term, 0)  
-            unk = self.lambda_unk / len(self.probabilities)
-            collection_prob = self.collection_probability.get(term, unk)
-
-            # Dirichlet smoothing formula
-            term_probability = (doc_term_freq + self.mu * collection_prob) / (self.doc_lengths[doc_idx] + self.mu)
-            score += math.log(term_probability)
+    def term_postings(self, term_idx):
+        """
+        Return the (document indices, term counts) stored for a term row of the matrix,
+        followed by the postings added since the matrix was built.
+        """
+        if term_idx < self.term_doc_matrix.shape[0]:
+            start, end = self.term_doc_matrix.indptr[term_idx], self.term_doc_matrix.indptr[term_idx + 1]
+            doc_indices, term_counts = self.term_doc_matrix.indices[start:end], self.term_doc_matrix.data[start:end]
+        else:
+            doc_indices, term_counts = np.zeros(0, dtype=np.int64), np.zeros(0)
 
-        return score
+        if term_idx in self.pending_postings:
+            pending_indices, pending_counts = self.pending_postings[term_idx]
+            doc_indices = np.concatenate([doc_indices, pending_indices])
+            term_counts = np.concatenate([term_counts, pending_counts])
+        return doc_indices, term_counts
 
-    def compute_jm_score(self, query, doc_idx):
+    def compute_dirichlet_scores(self, query_terms):
         """
-        Compute the Language Model score using Jelinek-Mercer smoothing.
+        Compute the Language Model scores using Dirichlet smoothing.
+        log((tf + mu * P(w|C)) / (|d| + mu)) is split into a background score
+        log(mu * P(w|C)) - log(|d| + mu) shared by every document and a sparse
+        correction log(1 + tf / (mu * P(w|C))) for the documents containing the term.
         """
-        query_terms = word_tokenize(query.lower())
-        score = 0
-        doc_id = self.documents[doc_idx].doc_id
+        scores = np.zeros(len(self.doc_lengths))
+        background = 0
+        unk = self.lambda_unk / len(self.vocabulary)
 
         for term in query_terms:
-            doc_term_freq = self.doc_frequencies.get(doc_id, {}).get(term, 0)  
-            collection_prob = self.collection_probability.get(term, 0)
-
-            # Jelinek-Mercer smoothing formula
-            term_probability = (1 - self.lambda_jm) * (doc_term_freq / (self.doc_lengths[doc_idx] + 1e-10)) + self.lambda_jm * collection_prob
-            term_probability = max(term_probability, 1e-10)  # Avoid log(0)
-            score += math.log(term_probability)
+            term_idx = self.term_index(term)
+            collection_prob = unk if term_idx is None else self.collection_probability[term_idx]
+            background += math.log(self.mu * collection_prob)
 
-        return score
+            if term_idx is not None:
+                doc_indices, term_counts = self.term_postings(term_idx)
+                scores[doc_indices] += np.log1p(term_counts / (self.mu * collection_prob))
 
+        return scores + background - len(query_terms) * np.log(self.doc_lengths + self.mu)
 
-    def generate_snippet(self, content, query_terms, snippet_length=30):
+    def compute_jm_scores(self, query_terms):
         """
-        Generate a snippet from the document containing the query terms,
-        with surrounding context and highlighted terms.
+        Compute the Language Model scores using Jelinek-Mercer smoothing.
+        Documents without the term all share the background probability lambda * P(w|C),
+        so only the documents containing the term need a correction.
         """
-        tokens = content.split()
-        query_terms_lower = [term.lower() for term in query_terms]
-        query_indices = [i for i, token in enumerate(tokens) if token.lower() in query_terms_lower]
+        scores = np.zeros(len(self.doc_lengths))
+        background = 0
 
-        if not query_indices:
-            return "No relevant snippet found."
-
-        # Generate snippet around the first matching term
-        start_index = max(0, query_indices[0] - snippet_length // 2)
-        end_index = min(len(tokens), query_indices[0] + snippet_length // 2)
-
-        snippet = " ".join(tokens[start_index:end_index])
-        return snippet + "..." if end_index < len(tokens) else snippet
\ No newline at end of file
+        for term in query_terms:
+            term_idx = self.term_index(term)
+            collection_prob = 0 if term_idx is None else self.collection_probability[term_idx]
+            background_prob = max(self.lambda_jm * collection_prob, 1e-10)  # Avoid log(0)
+            background += math.log(background_prob)
+
+            if term_idx is not None:
+                doc_indices, term_counts = self.term_postings(term_idx)
+                # Jelinek-Mercer smoothing formula
+                term_probability = ((1 - self.lambda_jm) * (term_counts / (self.doc_lengths[doc_indices] + 1e-10))
+                                    + self.lambda_jm * collection_prob)
+                term_probability = np.maximum(term_probability, 1e-10)
+                scores[doc_indices] += np.log(term_probability) - math.log(background_prob)
+
+        return scores + background
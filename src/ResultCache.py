@@ -0,0 +1,84 @@
+import sys
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        """
+        LRU cache of ranked results, bounded by entry count and by the bytes of the cached arrays.
+        Entries belong to one index generation: the first access with another generation
+        (the index was rebuilt, reloaded or changed) empties the cache.
+        :param max_entries: Most entries kept.
+        :param max_bytes: Most bytes kept (numpy arrays by nbytes, other values by sys.getsizeof).
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, bytes), least recently used first
+        self.generation = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize_query(text):
+        return " ".join(text.lower().split())
+
+    @staticmethod
+    def value_size(value):
+        return sum(item.nbytes if hasattr(item, "nbytes") else sys.getsizeof(item) for item in value)
+
+    def check_generation(self, generation):
+        if generation != self.generation:
+            if self.entries:
+                self.invalidations += 1
+            self.clear()
+            self.generation = generation
+
+    def get(self, key, generation):
+        """
+        Cached value of a key on this index generation, or None.
+        """
+        self.check_generation(generation)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, generation):
+        """
+        Cache a value (a tuple of arrays and small objects), evicting the least recently used entries.
+        """
+        self.check_generation(generation)
+        size = self.value_size(value)
+        if size > self.max_bytes:
+            return  # Would evict everything else
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "generation": self.generation,
+        }
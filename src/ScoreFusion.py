@@ -0,0 +1,99 @@
+import numpy as np
+
+
+def rank_scores(scores, k=None):
+    """
+    Indices of the retrieved documents (non-NaN scores), best first, ties broken by
+    document index. With k, only the top-k are selected (argpartition) and sorted.
+    """
+    candidates = np.flatnonzero(~np.isnan(scores))
+    if k is not None and k < len(candidates):
+        if k <= 0:
+            return candidates[:0]
+        values = scores[candidates]
+        kth = -np.partition(-values, k - 1)[k - 1]
+        better = candidates[values > kth]
+        tied = candidates[values == kth][:k - len(better)]  # Lowest indices first, as in a full sort
+        candidates = np.concatenate([better, tied])
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+class ScoreFusion:
+    METHODS = ("combsum", "combmnz", "rrf")
+    NORMALIZATIONS = ("minmax", "zscore", None)
+
+    def __init__(self, method="combsum", normalization="minmax", weights=None, rrf_k=60):
+        """
+        Fuse the rankings of several retrieval models given as aligned score vectors
+        (one score per document index, NaN where a model did not retrieve the document).
+        :param method: "combsum", "combmnz" or "rrf" (Reciprocal Rank Fusion).
+        :param normalization: "minmax", "zscore" or None; applied per model before CombSUM/CombMNZ.
+        :param weights: Weight per model (defaults to equal weights).
+        :param rrf_k: Rank offset of Reciprocal Rank Fusion.
+        """
+        if method not in self.METHODS:
+            raise ValueError("Invalid fusion method. Choose 'combsum', 'combmnz' or 'rrf'.")
+        if normalization not in self.NORMALIZATIONS:
+            raise ValueError("Invalid normalization. Choose 'minmax', 'zscore' or None.")
+        self.method = method
+        self.normalization = normalization
+        self.weights = weights
+        self.rrf_k = rrf_k
+
+    def normalize(self, scores, retrieved):
+        """
+        Normalize every row of a models x documents score matrix over its retrieved documents.
+        """
+        if self.normalization == "minmax":
+            mins = np.where(retrieved, scores, np.inf).min(axis=1, keepdims=True)
+            maxs = np.where(retrieved, scores, -np.inf).max(axis=1, keepdims=True)
+            ranges = maxs - mins
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(ranges > 0, (scores - mins) / ranges, 1.0)
+        if self.normalization == "zscore":
+            counts = np.maximum(retrieved.sum(axis=1, keepdims=True), 1)
+            means = np.where(retrieved, scores, 0).sum(axis=1, keepdims=True) / counts
+            stds = np.sqrt(np.where(retrieved, (scores - means) ** 2, 0).sum(axis=1, keepdims=True) / counts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(stds > 0, (scores - means) / stds, 0.0)
+        return scores
+
+    def reciprocal_ranks(self, scores, retrieved):
+        """
+        1 / (rrf_k + rank) per model and document, 0 where the document was not retrieved.
+        """
+        contributions = np.zeros(scores.shape)
+        for row in range(scores.shape[0]):
+            ranked = rank_scores(scores[row])
+            contributions[row, ranked] = 1.0 / (self.rrf_k + np.arange(1, len(ranked) + 1))
+        return contributions
+
+    def fuse(self, score_vectors, k=None, boost=None):
+        """
+        Fuse aligned score vectors and return the top-k documents.
+        :param score_vectors: One array per model, indexed by document, NaN for non-retrieved documents.
+        :param k: Number of fused documents to return (None returns every retrieved document).
+        :param boost: Optional sparse (document indices, boosts) added to the fused scores of retrieved
+            documents (e.g. InteractionStore.boost_vector), before ranking.
+        :return: (document indices best first, fused score vector)
+        """
+        scores = np.vstack(score_vectors)
+        retrieved = ~np.isnan(scores)
+        weights = np.ones(len(scores)) if self.weights is None else np.asarray(self.weights, dtype=np.float64)
+        if len(weights) != len(scores):
+            raise ValueError("Expected one fusion weight per model.")
+
+        if self.method == "rrf":
+            contributions = self.reciprocal_ranks(scores, retrieved)
+        else:
+            contributions = np.where(retrieved, self.normalize(scores, retrieved), 0)
+
+        fused = weights @ contributions
+        if self.method == "combmnz":
+            fused *= retrieved.sum(axis=0)  # Reward documents retrieved by several models
+        fused[~retrieved.any(axis=0)] = np.nan
+        if boost is not None:
+            indices, values = boost
+            fused[indices] += values  # Non-retrieved documents stay NaN
+
+        return rank_scores(fused, k), fused
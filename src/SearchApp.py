@@ -1,36 +1,41 @@
-import json,os
+import argparse
+import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, PhotoImage
-from VectorSpaceModel import VectorSpaceModel
-from BestMatching25 import BM25
-from LanguageModel import MultinomialLanguageModel
-from TextPreprocessor import TextPreprocessor
-from TF_IDF_Builder import TF_IDF_Builder
+from SearchEngine import SearchEngine
 from SearchLogger import SearchLogger
+from InteractionStore import InteractionStore
+from Instrumentation import instrumentation
+from Query import Query
 from utils import IconLoadUtilities
 import threading, asyncio
 from datetime import datetime
-import xml.etree.ElementTree as ET
-from Query import Query
-from utils import TRECUtilities
 import numpy as np
 
+FUSED_RESULTS = 100  # Documents shown per query after fusion
+
 class SearchApp:
-    def __init__(self, master):
+    def __init__(self, master, build_workers=1):
+        """
+        :param build_workers: Worker processes used to analyze documents when building the index.
+            With more than one, the three models are also built concurrently.
+        """
         self.master = master
-        self.tf_idf= TF_IDF_Builder(TextPreprocessor())
-        self.vsm = VectorSpaceModel(self.tf_idf, TRECUtilities( "vsm_results.trec"))
-        self.lm = MultinomialLanguageModel(self.tf_idf,TRECUtilities( "lm_results.trec"),
-                                            mu=1000, lambda_unk=0.0001, lambda_jm=0.2)
-        self.bm25 = BM25(self.tf_idf,TRECUtilities( "bm25_results.trec"))
+        self.engine = SearchEngine(build_workers, interactions=InteractionStore())  # Viewed documents are boosted
+        self.tf_idf = self.engine.tf_idf
+        self.vsm = self.engine.vsm
+        self.lm = self.engine.lm
+        self.bm25 = self.engine.bm25
         self.folder_path = None
         self.current_page = 1
         self.txt_image = None
         self.utils = IconLoadUtilities(master)
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        self.logger = SearchLogger(f"Search_log_{timestamp}.log")
+        self.logger = SearchLogger(f"Search_log_{timestamp}.jsonl")
+        instrumentation.enabled = True  # Every interactive query is logged with its latency breakdown
         self.queries = []
         self.results = None
+        self.last_query_text = ""  # Query text of the displayed results; document views are recorded under it
 
         self.documents = []
 
@@ -68,23 +73,27 @@ class SearchApp:
             return
 
         try:
-           
-            self.documents = self.tf_idf.load_documents(self.folder_path)
-
-             #Build VSM Index
-            self.vsm.build_index(self.documents)
-
-            #Build BM25 Index
-            self.bm25.build_index(self.documents)
-
-            #Build LM Index
-            self.lm.build_index(self.documents)
+            # Reuse the saved index when the collection has not changed since it was built
+            self.engine.open_index(self.folder_path)
+            self.documents = self.engine.documents
 
             messagebox.showinfo("Success", "Index built successfully!")
             self.page2()
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
+    def add_documents(self, documents):
+        """
+        Add documents to every model without rebuilding the index.
+        """
+        self.engine.add_documents(documents)
+
+    def remove_documents(self, doc_indices):
+        """
+        Remove documents (by index) from every model without rebuilding the index.
+        """
+        self.engine.remove_documents(doc_indices)
+
     def page2(self):
         self.clear_frame()
         self.master.title("Search Documents")
@@ -156,28 +165,29 @@ class SearchApp:
         self.next_button.pack(side=tk.LEFT, padx=5)
 
     def load_queries(self, file_path):
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        for idx,top in enumerate(root.findall("top")):
-            query_id = top.find("num").text.strip()
-            query_text = top.find("title").text.strip()
-            query_obj = Query(idx+1, query_text)
-            self.queries.append(query_obj)
-        
+        self.queries.extend(SearchEngine.load_queries(file_path))
         return self.queries
     
     async def search_query(self,query):
         self.current_page = 1
-        vsm_results = self.vsm.search(query)
-        bm25_results = self.bm25.search(query)
-        lm_results = self.lm.search(query, smoothing="jm")
-
-        self.results = self.combine_results(vsm_results, bm25_results, lm_results)
-        curr_results = self.get_curr_results(self.current_page, 15)
+        query_text = query.query_name  # Replaced by its preprocessed form while scoring
+        self.last_query_text = query_text
+        with instrumentation.trace("search_query", query_text) as trace:
+            # Repeated queries are served from the engine's result cache
+            ranking = self.engine.rank_query(query, FUSED_RESULTS)
+
+            # Per-model runs for trec_eval (the top FUSED_RESULTS documents cover the run depth)
+            for name, model in (("vsm", self.vsm), ("bm25", self.bm25), ("lm", self.lm)):
+                model.results_from_scores(query, self.engine.score_vector_from_ranking(*ranking[name]))
+
+            self.results = self.combine_results(query, ranking["fused"])
+            instrumentation.count("search_query.results", len(self.results))
+            curr_results = self.get_curr_results(self.current_page, 15)
 
-        query.add_result(curr_results)
-        await self.display_results(query.results)
+            query.add_result(curr_results)
+            with instrumentation.stage("search_query.display"):
+                await self.display_results(query.results)
+        self.logger.log_search(query_text, self.results, trace)
 
     async def search(self):
         """
@@ -194,83 +204,43 @@ class SearchApp:
         self.queries = self.load_queries(self.folder_path+"/cran.qry.xml")
         for query in self.queries:
             await self.search_query(query)
+        self.logger.log_histograms(instrumentation.histograms())
+        self.logger.log_event("cache", **self.engine.cache.stats())
 
-    def combine_results(self, vsm_results, bm25_results, lm_results):
+    def combine_results(self, query, fused_ranking):
         """
-        Combines results from VSM, BM25, and LM into a single list for display.
-        
-        This method ensures that documents are merged based on their doc_id, 
-        adding scores from VSM, BM25, and LM. If a document is not present in 
-        one of the result sets, its score for that method is set to 0.
-        
+        Turns the fused VSM, BM25 and LM ranking into a single list for display.
+
+        The engine fuses the models' score vectors (aligned by document index) with its
+        ScoreFusion, boosting documents viewed before for the query; only the fused top-k
+        documents are turned into result entries.
+
         Args:
-            vsm_results (list of dict): List of dictionaries containing VSM results.
-            bm25_results (list of dict): List of dictionaries containing BM25 results.
-            lm_results (list of dict): List of dictionaries containing LM results.
-        
+            query (Query): The query, used for the snippets.
+            fused_ranking (tuple): The "fused" entry of SearchEngine.rank_query: document indices,
+                                   fused scores and the VSM, BM25 and LM scores of those documents.
+
         Returns:
-            list of dict: A combined list of dictionaries with merged results 
-                          from VSM, BM25, and LM, including scores and metadata.
+            list of dict: Fused results, best first: document index, doc id, fused score,
+                          per-model scores (0 if not retrieved) and snippet.
         """
-        combined_dict = {}
-
-        # Add VSM results
-        for vsm_result in vsm_results:
-            doc_id = vsm_result["doc_id"]
-            combined_dict[doc_id] = {
-                "doc_id": doc_id,
-                "file_name": vsm_result["file_name"],
-                "path": vsm_result["path"],
-                "original_text": vsm_result["original_text"],
-                "extension": vsm_result["extension"],
-                "vsm_score": vsm_result["score"],
-                "bm25_score": 0,  # Default score if not in BM25 results
-                "lm_score": 0,
-                "snippet": vsm_result["snippet"],
-                "bibliography": vsm_result["bibliography"],
-                "author": vsm_result["author"]
-            }
-
-        # Merge BM25 results
-        for bm25_result in bm25_results:
-            doc_id = bm25_result["doc_id"]
-            if doc_id in combined_dict:
-                combined_dict[doc_id]["bm25_score"] = bm25_result["score"]
-            else:
-                combined_dict[doc_id] = {
-                    "doc_id": doc_id,
-                    "file_name": bm25_result["file_name"],
-                    "path": bm25_result["path"],
-                    "original_text": bm25_result["original_text"],
-                    "extension": bm25_result["extension"],
-                    "vsm_score": 0,  # Default score if not in VSM results
-                    "bm25_score": bm25_result["score"],
-                    "lm_score": 0,
-                    "snippet": bm25_result["snippet"],
-                    "bibliography": bm25_result["bibliography"],
-                    "author": bm25_result["author"]
-                }
-
-        # Merge LM results
-        for lm_result in lm_results:
-            doc_id = lm_result["doc_id"]
-            if doc_id in combined_dict:
-                combined_dict[doc_id]["lm_score"] = lm_result["score"]
-            else:
-                combined_dict[doc_id] = {
-                    "doc_id": doc_id,
-                    "file_name": lm_result["file_name"],
-                    "path": lm_result["path"],
-                    "original_text": lm_result["original_text"],
-                    "extension": lm_result["extension"],
-                    "vsm_score": 0,  # Default score if not in VSM results
-                    "bm25_score": 0,
-                    "lm_score": lm_result["score"],
-                    "snippet": lm_result["snippet"],
-                    "bibliography": lm_result["bibliography"],
-                    "author": lm_result["author"]
-                }
-        return list(combined_dict.values())
+        ranked_indices, fused_scores, model_scores = fused_ranking
+        model_scores = np.nan_to_num(model_scores)
+
+        # Results carry only document indices and scores; metadata is read from the store on display
+        combined_results = []
+        for position, doc_idx in enumerate(ranked_indices):
+            vsm_score, bm25_score, lm_score = model_scores[:, position].tolist()
+            combined_results.append({
+                "doc_idx": int(doc_idx),
+                "doc_id": self.tf_idf.documents.doc_ids[doc_idx],
+                "score": float(fused_scores[position]),
+                "vsm_score": vsm_score,
+                "bm25_score": bm25_score,
+                "lm_score": lm_score,
+                "snippet": self.tf_idf.snippets.lazy(doc_idx, query.query_name.split())
+            })
+        return combined_results
         
     
     def get_curr_results(self, page, results_per_page):
@@ -321,7 +291,7 @@ class SearchApp:
         
         # Update the Treeview with icons in the main thread
         for i, result in enumerate(results["results"]):
-            if result["file_name"].endswith(".txt"):
+            if self.documents[result["doc_idx"]].file_name.endswith(".txt"):
                 # Use a lambda to delay the execution and pass the required arguments
                 self.master.after(0, lambda idx=i: self.results_tree.item(idx, image=self.txt_image ))
                 
@@ -354,7 +324,7 @@ class SearchApp:
         for i, result in enumerate(self.current_results):
             self.results_tree.insert("", tk.END, iid=i, text="", 
             values=(
-                result["file_name"], 
+                self.documents[result["doc_idx"]].file_name, 
                 f"VSM: {result['vsm_score']:.2f}, BM25: {result['bm25_score']:.2f}, LM: {result['lm_score']:.2f}"
             ))
     
@@ -381,20 +351,22 @@ class SearchApp:
         # Get the index of the selected document
         selected_index = int(selected_item[0])  # Treeview item ID corresponds to the index
         selected_doc = self.current_results[selected_index]
+        document = self.documents[selected_doc["doc_idx"]]
 
         # Display metadata
         metadata_text = (
-            f"Title: {selected_doc['file_name']}\n"
-            f"Author: {selected_doc['author']}\n"
-            f"Bibliography: {selected_doc['bibliography']}\n"
+            f"Title: {document.file_name}\n"
+            f"Author: {document.author}\n"
+            f"Bibliography: {document.bibliography}\n"
             f"VSM Score: {selected_doc['vsm_score']:.2f}\n"
             f"BM25 Score: {selected_doc['bm25_score']:.2f}\n"
-            f"Language Model Score: {selected_doc['lm_score']:.2f}"
+            f"Language Model Score: {selected_doc['lm_score']:.2f}\n"
+            f"Fused Score: {selected_doc['score']:.2f}"
         )
         self.metadata_label.config(text=metadata_text)
 
         # Display and highlight snippet
-        snippet = selected_doc["snippet"]
+        snippet = str(selected_doc["snippet"])  # Snippets are generated lazily on first display
         self.snippet_text.config(state=tk.NORMAL)
         self.snippet_text.delete("1.0", tk.END)
         self.snippet_text.insert(tk.END, snippet)
@@ -430,7 +402,7 @@ class SearchApp:
         await self.display_results(curr_results)
 
     def search_query_button_handler(self):
-        asyncio.run(self.search_query(self.query_entry.get().strip().lower()))  
+        asyncio.run(self.search_query(Query(len(self.queries) + 1, self.query_entry.get().strip().lower())))  
 
     def search_button_handler(self):
         asyncio.run(self.search())
@@ -461,24 +433,24 @@ class SearchApp:
         # Get the index of the selected document
         selected_index = int(selected_item[0])  # Treeview item ID corresponds to the index
         selected_doc = self.current_results[selected_index]
+        document = self.documents[selected_doc["doc_idx"]]
 
-        # Log the interaction for the query and document
-        query = self.query_entry.get().strip().lower()
+        # Log the interaction under the query that ranked the displayed results (its boosts use the same key)
         doc_id = selected_doc["doc_id"]  # Unique identifier for the document
-        self.log_interaction(query, doc_id)
+        self.log_interaction(self.last_query_text, doc_id)
 
         # Check if the file exists
-        file_path = selected_doc["path"]
+        file_path = document.path
         if not os.path.exists(file_path):
             messagebox.showerror("Error", f"The file does not exist: {file_path}")
             return
         
          # Log the document opening
-        self.logger.log_click(self.query, selected_doc["doc_id"], selected_doc["file_name"])
+        self.logger.log_click(self.last_query_text, selected_doc["doc_id"], document.file_name)
 
         # Create a new popup window to display content
         popup = tk.Toplevel(self.master)
-        popup.title(f"Viewing: {selected_doc['file_name']}")
+        popup.title(f"Viewing: {document.file_name}")
         popup.geometry("600x400")
 
         # Bind close event to log the time spent
@@ -486,7 +458,7 @@ class SearchApp:
 
         # Add a scrollable Text widget to display file content
         text_widget = tk.Text(popup, wrap=tk.WORD)
-        text_widget.insert("1.0", selected_doc["original_text"])
+        text_widget.insert("1.0", document.original_text)  # Read from the memory-mapped text store
         text_widget.config(state=tk.DISABLED)  # Make content read-only
         text_widget.pack(fill=tk.BOTH, expand=True)
 
@@ -496,38 +468,25 @@ class SearchApp:
         text_widget.config(yscrollcommand=scrollbar.set)
 
     def log_interaction(self, query, doc_id):
-        # Load interaction data (from memory or file)
-        try:
-            with open("interaction_data.json", "r") as f:
-                self.interaction_data = json.load(f)
-        except FileNotFoundError:
-            self.interaction_data = {}
-
-        # Update interaction data
-        if query not in self.interaction_data:
-            self.interaction_data[query] = {}
-        if doc_id not in self.interaction_data[query]:
-            self.interaction_data[query][doc_id] = {"views": 0, "score_boost": 0.0}
-
-        self.interaction_data[query][doc_id]["views"] += 1
-        self.interaction_data[query][doc_id]["score_boost"] += 0.1  # Increment boost
-
-        # Save interaction data back to file
-        with open("interaction_data.json", "w") as f:
-            json.dump(self.interaction_data, f)
+        # One appended log line; the boost applies from the next search of this query
+        self.engine.interactions.record_view(query, doc_id)
 
     def close_document(self, selected_doc, popup):
         """Logs when a document is closed and records time spent."""
         doc_id = selected_doc["doc_id"]
 
         if doc_id in self.logger.opened_docs:
-            self.logger.log_close(self.query, doc_id, selected_doc["file_name"])
+            self.logger.log_close(self.last_query_text, doc_id, self.documents[selected_doc["doc_idx"]].file_name)
 
         popup.destroy()  # Close the pop-up window
 
 
 # Main Program
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search a document collection with VSM, BM25 and LM.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes used to build the index")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = SearchApp(root)
+    app = SearchApp(root, build_workers=args.workers)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,238 @@
+import itertools
+import os
+import numpy as np
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from VectorSpaceModel import VectorSpaceModel
+from BestMatching25 import BM25
+from LanguageModel import MultinomialLanguageModel
+from TextPreprocessor import TextPreprocessor
+from TF_IDF_Builder import TF_IDF_Builder
+from DocumentAnalyzer import DocumentAnalyzer
+from IndexStore import IndexStore
+from ScoreFusion import ScoreFusion, rank_scores
+from ResultCache import ResultCache
+from Instrumentation import instrumentation
+from Query import Query
+from utils import TRECUtilities
+
+INDEX_DIR_NAME = ".search_index"  # Saved index, kept inside the indexed folder
+MODELS = ("vsm", "bm25", "lm")
+LM_SMOOTHING = "jm"  # Smoothing of the LM scores of every search
+
+
+class SearchEngine:
+    def __init__(self, build_workers=1, clear_runs=True, interactions=None, cache=None):
+        """
+        The retrieval models and their saved index, without any user interface.
+        :param build_workers: Worker processes used to analyze documents when building the index.
+            With more than one, the three models are also built concurrently.
+        :param clear_runs: Clear the models' TREC run files on creation.
+        :param interactions: Optional InteractionStore whose per-query boosts are added to the fused scores.
+        :param cache: ResultCache of rank_query (a default-sized one when not given).
+        """
+        self.tf_idf = TF_IDF_Builder(TextPreprocessor())
+        self.vsm = VectorSpaceModel(self.tf_idf, TRECUtilities("vsm_results.trec", clear=clear_runs))
+        self.lm = MultinomialLanguageModel(self.tf_idf, TRECUtilities("lm_results.trec", clear=clear_runs),
+                                           mu=1000, lambda_unk=0.0001, lambda_jm=0.2)
+        self.bm25 = BM25(self.tf_idf, TRECUtilities("bm25_results.trec", clear=clear_runs))
+        self.fusion = ScoreFusion(method="combsum", normalization="minmax", weights=[1.0, 1.0, 1.0])  # VSM, BM25, LM
+        self.build_workers = build_workers
+        self.analyzer = DocumentAnalyzer(self.tf_idf.preprocessor, workers=build_workers)
+        self.documents = []
+        self.interactions = interactions
+        self.doc_index_cache = None  # Doc id -> document index, for the interaction boosts
+        self.cache = cache if cache is not None else ResultCache()
+        self.generation = 0  # Bumped whenever the index changes; invalidates the cached results
+
+    def open_index(self, folder_path):
+        """
+        Load the saved index of a folder, or build and save it when the collection
+        has changed since it was built.
+        """
+        store = IndexStore(os.path.join(folder_path, INDEX_DIR_NAME))
+        checksum = IndexStore.folder_checksum(folder_path)
+        if store.is_current(checksum):
+            self.load_index(store)
+        else:
+            self.build_and_save_index(folder_path, store, checksum)
+
+    def build_and_save_index(self, folder_path, store, checksum):
+        self.documents = self.tf_idf.load_documents(folder_path)
+        self.doc_index_cache = None
+        self.generation += 1
+
+        # Parse every document once; all three models index the shared analyses
+        analyses = self.analyzer.analyze_all(self.documents)
+
+        if self.build_workers > 1:
+            # The model builds are independent once documents are analyzed
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                builds = [executor.submit(model.build_index, self.documents, analyses)
+                          for model in (self.vsm, self.bm25, self.lm)]
+                for build in builds:
+                    build.result()
+        else:
+            #Build VSM Index
+            self.vsm.build_index(self.documents, analyses)
+
+            #Build BM25 Index
+            self.bm25.build_index(self.documents, analyses)
+
+            #Build LM Index
+            self.lm.build_index(self.documents, analyses)
+
+        store.invalidate()
+        self.tf_idf.save(store.path("tfidf"))
+        self.vsm.save(store.path("vsm"))
+        self.bm25.save(store.path("bm25"))
+        self.lm.save(store.path("lm"))
+        store.write_manifest(checksum)  # Written last: marks the index as complete
+
+    def load_index(self, store):
+        self.documents = self.tf_idf.load(store.path("tfidf"))
+        self.doc_index_cache = None
+        self.generation += 1
+        self.vsm.load(store.path("vsm"))
+        self.bm25.load(store.path("bm25"))
+        self.lm.load(store.path("lm"))
+
+    def add_documents(self, documents):
+        """
+        Add documents to every model without rebuilding the index.
+        """
+        documents = list(documents)
+        analyses = self.analyzer.analyze_all(documents)
+        self.tf_idf.add_documents(documents)  # Models refer to documents by index in this store
+        self.vsm.add_documents(documents, analyses)
+        self.bm25.add_documents(documents, analyses)
+        self.lm.add_documents(documents, analyses)
+        self.generation += 1
+
+    def remove_documents(self, doc_indices):
+        """
+        Remove documents (by index) from every model without rebuilding the index.
+        """
+        self.vsm.remove_documents(doc_indices)
+        self.bm25.remove_documents(doc_indices)
+        self.lm.remove_documents(doc_indices)
+        self.generation += 1
+
+    def score_query(self, query, models=MODELS):
+        """
+        Score a query with the given models, returning model name -> score vector
+        aligned with the document indices (NaN where the model did not retrieve a document).
+        """
+        scores = {}
+        if "vsm" in models:
+            scores["vsm"] = self.vsm.score_vector(query)
+        else:
+            # BM25 and LM always see the query as preprocessed by VSM
+            query.query_name = self.vsm.preprocess_query(query.query_name)
+        if "bm25" in models:
+            scores["bm25"] = self.bm25.score_vector(query)
+        if "lm" in models:
+            scores["lm"] = self.lm.score_vector(query, smoothing=LM_SMOOTHING)
+        return scores
+
+    def score_queries(self, queries, models=MODELS):
+        """
+        Score a batch of queries with the given models, returning model name -> score matrix
+        with one row per query (as score_query), computed with each model's batched matrix products.
+        """
+        scores = {}
+        if "vsm" in models:
+            scores["vsm"] = self.vsm.score_matrix(queries)
+        else:
+            # BM25 and LM always see the query as preprocessed by VSM
+            for query in queries:
+                query.query_name = self.vsm.preprocess_query(query.query_name)
+        if "bm25" in models:
+            scores["bm25"] = self.bm25.score_matrix(queries)
+        if "lm" in models:
+            scores["lm"] = self.lm.score_matrix(queries, smoothing=LM_SMOOTHING)
+        return scores
+
+    def fuse(self, scores, k=None, query_text=None):
+        """
+        Fuse the VSM, BM25 and LM score vectors of a query; returns (document indices, fused scores).
+        :param query_text: The query as entered; documents viewed for it are boosted (with an InteractionStore).
+        """
+        with instrumentation.stage("fusion"):
+            boost = None
+            if self.interactions is not None and query_text:
+                boost = self.interactions.boost_vector(query_text, self.doc_index())
+            return self.fusion.fuse([scores[model] for model in MODELS], k, boost)
+
+    def run_parameters(self):
+        """
+        The parameters every run's ranking depends on, part of its result cache key.
+        """
+        return {
+            "vsm": (self.vsm.svd.n_components,),
+            "bm25": (self.bm25.k1, self.bm25.b),
+            "lm": (LM_SMOOTHING, self.lm.mu, self.lm.lambda_jm, self.lm.lambda_unk),
+            "fused": (self.fusion.method, self.fusion.normalization, None if self.fusion.weights is None else tuple(self.fusion.weights),
+                      self.fusion.rrf_k),
+        }
+
+    def rank_query(self, query, k=100):
+        """
+        Top-k documents of every model and of their fusion for one query, from the result cache
+        when the query was ranked before on the current index. The query text is replaced by its
+        preprocessed form, as score_query does.
+        :return: model name -> (document indices, scores) for each model, and "fused" ->
+            (document indices, fused scores, model x document matrix of the models' scores, NaN if not retrieved).
+            The arrays may be shared with the cache and must not be modified.
+        """
+        query_text = query.query_name
+        normalized = ResultCache.normalize_query(query_text)
+        parameters = self.run_parameters()
+        boosts = () if self.interactions is None else tuple(sorted(self.interactions.boosts(normalized).items()))
+        # One entry holds every run of the query, so each rank_query counts as one hit or one miss
+        key = (normalized, tuple(parameters[run] for run in MODELS + ("fused",)), boosts, k)
+
+        cached = self.cache.get(key, self.generation)
+        if cached is not None:
+            ranking = {model: cached[2 * i:2 * i + 2] for i, model in enumerate(MODELS)}
+            ranking["fused"], query.query_name = cached[2 * len(MODELS):-1], cached[-1]
+            return ranking
+
+        scores = self.score_query(query)
+        ranking = {}
+        for model in MODELS:
+            ranked_indices = rank_scores(scores[model], k)
+            ranking[model] = (ranked_indices.astype(np.int32), scores[model][ranked_indices])
+        ranked_indices, fused_scores = self.fuse(scores, k, query_text)
+        ranking["fused"] = (ranked_indices.astype(np.int32), fused_scores[ranked_indices],
+                            np.vstack([scores[model] for model in MODELS])[:, ranked_indices])
+
+        # Flat tuple of arrays (the cache sizes entries item by item): each model's pair, the fused triple, the query text
+        value = tuple(itertools.chain.from_iterable(ranking[run] for run in MODELS + ("fused",))) + (query.query_name,)
+        self.cache.put(key, value, self.generation)
+        return ranking
+
+    def score_vector_from_ranking(self, ranked_indices, ranked_scores):
+        """
+        Score vector aligned with the document indices holding only the ranked documents (NaN elsewhere).
+        """
+        scores = np.full(len(self.tf_idf.documents.doc_ids), np.nan)
+        scores[ranked_indices] = ranked_scores
+        return scores
+
+    def doc_index(self):
+        """
+        Doc id -> document index, rebuilt after the index is (re)loaded or documents are added.
+        """
+        doc_ids = self.tf_idf.documents.doc_ids
+        if self.doc_index_cache is None or self.doc_index_cache[0] != len(doc_ids):
+            self.doc_index_cache = (len(doc_ids), {str(doc_id): idx for idx, doc_id in enumerate(doc_ids)})
+        return self.doc_index_cache[1]
+
+    @staticmethod
+    def load_queries(file_path):
+        """
+        Read the queries of a TREC-style topics file (e.g. cran.qry.xml), numbered from 1.
+        """
+        root = ET.parse(file_path).getroot()
+        return [Query(idx + 1, top.find("title").text.strip()) for idx, top in enumerate(root.findall("top"))]
@@ -1,10 +1,93 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import sys
 import time
-from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, event name and the event's fields.
+    """
+    def format(self, record):
+        event = {"time": round(record.created, 6), "event": record.msg}
+        event.update(record.fields)
+        return json.dumps(event, default=str)
+
+
+class BatchedFlushMixin:
+    """
+    Flush the file every batch_size records or flush_interval seconds instead of after
+    every record (StreamHandler.emit calls flush once per record).
+    """
+    def __init__(self, *args, batch_size=256, flush_interval=1.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        self.pending += 1
+        if self.pending >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush_now()
+
+    def flush_now(self):
+        super().flush()
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+
+class BatchedRotatingFileHandler(BatchedFlushMixin, RotatingFileHandler):
+    pass
+
+
+class BatchedTimedRotatingFileHandler(BatchedFlushMixin, TimedRotatingFileHandler):
+    pass
+
+
+class EventQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Events are formatted on the writer thread, not on the search thread
+        return record
+
+
+class FlushingQueueListener(QueueListener):
+    """
+    Writer thread that also flushes pending batches whenever the queue has been idle for flush_interval.
+    """
+    def __init__(self, event_queue, *handlers, flush_interval=1.0):
+        super().__init__(event_queue, *handlers)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    if isinstance(handler, BatchedFlushMixin) and handler.pending:
+                        handler.flush_now()
+
 
 class SearchLogger:
-    def __init__(self, log_file="search_log.txt", console_output=True):
+    def __init__(self, log_file="search_log.jsonl", console_output=True, max_bytes=10 * 1024 * 1024,
+                 backup_count=5, rotate_when=None, batch_size=256, flush_interval=1.0):
+        """
+        Structured search event log. Events are put on a queue by the search thread and
+        written as JSON Lines by a background writer thread, so logging an event costs
+        microseconds. The file is flushed in batches and rotated by size or by time.
+        :param log_file: JSON Lines file the events are appended to.
+        :param console_output: Also echo the events to stdout (from the writer thread).
+        :param max_bytes: Rotate once the file reaches this size (size-based rotation).
+        :param backup_count: Rotated files kept.
+        :param rotate_when: Rotate by time instead, e.g. "midnight" or "H" (see TimedRotatingFileHandler).
+        :param batch_size: Records written between two flushes of the file.
+        :param flush_interval: Longest time in seconds a written record waits for a flush.
+        """
         self.log_file = log_file
         self.console_output = console_output
         self.opened_docs = {}  # To store timestamps when a document is opened
@@ -14,30 +97,55 @@ class SearchLogger:
         if log_dir and not os.path.exists(log_dir):
             os.makedirs(log_dir)
 
-        # Configure logging
-        logging.basicConfig(
-            filename=self.log_file,
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S"
-        )
+        batching = {"batch_size": batch_size, "flush_interval": flush_interval}
+        if rotate_when:
+            file_handler = BatchedTimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count,
+                                                           encoding="utf-8", **batching)
+        else:
+            file_handler = BatchedRotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                      encoding="utf-8", **batching)
+        handlers = [file_handler]
+        if console_output:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        formatter = JsonLinesFormatter()
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        # Events bypass the logger hierarchy (and its caller lookup): they never reach or depend on the root logger
+        event_queue = queue.SimpleQueue()
+        self.queue_handler = EventQueueHandler(event_queue)
+        self.listener = FlushingQueueListener(event_queue, *handlers, flush_interval=flush_interval)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def log_event(self, event, **fields):
+        """Queues one event; fields must be JSON-serialisable and not modified afterwards."""
+        if self.listener is None:
+            return  # Closed
+        record = logging.LogRecord(__name__, logging.INFO, "", 0, event, None, None)
+        record.fields = fields
+        self.queue_handler.enqueue(record)
 
     def log_query(self, query):
         """Logs when a user performs a search query."""
-        log_message = f"SEARCH: User queried -> '{query}'"
-        logging.info(log_message)
-        if self.console_output:
-            print(log_message)
+        self.log_event("query", query=query)
+
+    def log_search(self, query, results, trace=None):
+        """
+        Logs a completed search: the query, the number and doc ids of the results and,
+        given a finished Instrumentation trace, its latency breakdown in nanoseconds.
+        """
+        fields = {"query": query, "result_count": len(results), "doc_ids": [result["doc_id"] for result in results]}
+        if getattr(trace, "stages", None) is not None:  # Not the no-op stage of disabled instrumentation
+            fields.update(latency_ns=trace.total_ns, stages=dict(trace.stages), counters=dict(trace.counters))
+        self.log_event("search", **fields)
 
     def log_click(self, query, doc_id, filename):
         """Logs when a user clicks to view a document and starts tracking time."""
         timestamp = time.time()  # Store the opening time
         self.opened_docs[doc_id] = timestamp
 
-        log_message = f"CLICK: Query '{query}' -> Opened document [{doc_id}] {filename}"
-        logging.info(log_message)
-        if self.console_output:
-            print(log_message)
+        self.log_event("click", query=query, doc_id=doc_id, filename=filename)
 
     def log_close(self, query, doc_id, filename):
         """Logs when a user closes a document and records time spent."""
@@ -47,7 +155,22 @@ class SearchLogger:
         open_time = self.opened_docs.pop(doc_id)
         time_spent = round(time.time() - open_time, 2)  # Calculate duration
 
-        log_message = f"CLOSE: Query '{query}' -> Closed document [{doc_id}] {filename} | Time spent: {time_spent} sec"
-        logging.info(log_message)
-        if self.console_output:
-            print(log_message)
\ No newline at end of file
+        self.log_event("close", query=query, doc_id=doc_id, filename=filename, time_spent=time_spent)
+
+    def log_trace(self, trace):
+        """Logs the per-stage timings (nanoseconds) and counters of one query (an Instrumentation trace)."""
+        self.log_event("trace", **trace.to_dict())
+
+    def log_histograms(self, histograms):
+        """Logs the rolling latency percentiles of every stage (Instrumentation.histograms())."""
+        self.log_event("latency", stages=histograms)
+
+    def close(self):
+        """Writes the queued events and flushes the file; further events are not written."""
+        if self.listener is None:
+            return
+        self.listener.stop()  # Handles every queued event before the writer thread exits
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+        atexit.unregister(self.close)
@@ -0,0 +1,101 @@
+import re
+from functools import lru_cache
+import numpy as np
+from Instrumentation import instrumentation
+
+
+class LazySnippet:
+    """
+    Handle to a snippet that is only generated when it is first displayed.
+    """
+    __slots__ = ("generator", "doc_idx", "query_terms", "_snippet")
+
+    def __init__(self, generator, doc_idx, query_terms):
+        self.generator = generator
+        self.doc_idx = doc_idx
+        self.query_terms = query_terms
+        self._snippet = None
+
+    def __str__(self):
+        if self._snippet is None:
+            with instrumentation.stage("snippets.generate"):
+                self._snippet = self.generator.generate(self.doc_idx, self.query_terms)
+        return self._snippet
+
+    def __repr__(self):
+        return f"LazySnippet(doc_idx={self.doc_idx}, query_terms={self.query_terms})"
+
+
+class SnippetGenerator:
+    def __init__(self, snippet_length=30, offsets_cache_size=1024):
+        """
+        Shared snippet service for all retrieval models.
+        :param snippet_length: Number of tokens in a snippet window.
+        :param offsets_cache_size: Number of documents whose token offsets are kept in memory.
+        """
+        self.snippet_length = snippet_length
+        self.offsets_cache_size = offsets_cache_size
+        self.documents = []
+        # Document index -> array of (start, end) character offsets of its tokens, computed on first use
+        self.token_offsets = lru_cache(maxsize=offsets_cache_size)(self.document_offsets)
+
+    def build(self, documents):
+        """
+        Attach the shared document store; texts are only read when a snippet is displayed.
+        """
+        self.documents = documents  # Shared document store, not copied
+        self.token_offsets = lru_cache(maxsize=self.offsets_cache_size)(self.document_offsets)
+
+    def document_offsets(self, doc_idx):
+        return self.compute_offsets(self.documents[doc_idx].original_text)
+
+    def compute_offsets(self, text):
+        offsets = [match.span() for match in re.finditer(r"\S+", text)]
+        return np.array(offsets, dtype=np.int64).reshape(-1, 2)
+
+    def lazy(self, doc_idx, query_terms):
+        """
+        Return a handle that generates the snippet of a document on demand.
+        """
+        return LazySnippet(self, doc_idx, query_terms)
+
+    def generate(self, doc_idx, query_terms):
+        """
+        Generate a snippet from the document around the window of snippet_length tokens
+        that contains the most distinct query terms (then the most matches).
+        """
+        text = self.documents[doc_idx].original_text
+        offsets = self.token_offsets(doc_idx)
+        query_terms_lower = {term.lower() for term in query_terms}
+        if not query_terms_lower or not len(offsets):
+            return "No relevant snippet found."
+
+        # Locate whole-token matches in one regex pass and map them to token positions
+        pattern = r"(?<!\S)(?:" + "|".join(re.escape(term) for term in query_terms_lower) + r")(?!\S)"
+        matches = [(match.start(), match.group().lower()) for match in re.finditer(pattern, text, re.IGNORECASE)]
+        if not matches:
+            return "No relevant snippet found."
+        positions = np.searchsorted(offsets[:, 0], [start for start, _ in matches])
+        terms = [term for _, term in matches]
+
+        # Best window: slide over match positions, keeping matches within snippet_length tokens
+        best_first, best_last, best_score = 0, 0, (0, 0)
+        last = 0
+        for first in range(len(positions)):
+            last = max(last, first)
+            while last + 1 < len(positions) and positions[last + 1] < positions[first] + self.snippet_length:
+                last += 1
+            score = (len(set(terms[first:last + 1])), last - first + 1)
+            if score > best_score:
+                best_first, best_last, best_score = first, last, score
+
+        # Centre the window on the matched span
+        span_start, span_end = positions[best_first], positions[best_last] + 1
+        start_index = max(0, span_start - (self.snippet_length - (span_end - span_start)) // 2)
+        end_index = min(len(offsets), start_index + self.snippet_length)
+        start_index = max(0, end_index - self.snippet_length)
+
+        snippet = " ".join(text[start:end] for start, end in offsets[start_index:end_index])
+        if start_index > 0:
+            snippet = "..." + snippet
+        return snippet + "..." if end_index < len(offsets) else snippet
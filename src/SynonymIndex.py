@@ -0,0 +1,98 @@
+import json
+import os
+import numpy as np
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synonym_index")
+
+
+class SynonymIndex:
+    def __init__(self, max_synonyms=3, threshold=0.6):
+        """
+        Nearest-neighbour index over the spaCy vocabulary vectors.
+        :param max_synonyms: Maximum number of similar words returned per lookup.
+        :param threshold: Minimum cosine similarity for a word to count as a synonym.
+        """
+        self.max_synonyms = max_synonyms
+        self.threshold = threshold
+        self.words = []
+        self.word_index = {}
+        self.vectors = np.zeros((0, 0), dtype=np.float32)  # L2-normalised, one row per word
+
+    def build(self, vocab):
+        """
+        Collect every alphabetic word with a vector and L2-normalise the vectors.
+        :param vocab: spaCy Vocab (nlp.vocab).
+        """
+        words, rows = [], []
+        for key, row in vocab.vectors.key2row.items():
+            if key not in vocab.strings:
+                continue
+            word = vocab.strings[key]
+            if word.isalpha() and word not in self.word_index:
+                self.word_index[word] = len(words)
+                words.append(word)
+                rows.append(row)
+
+        self.words = words
+        if not rows:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+            return
+
+        vectors = np.asarray(vocab.vectors.data[rows], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.vectors = vectors / norms
+
+    def save(self, index_dir, model_meta):
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, "vectors.npy"), self.vectors)
+        with open(os.path.join(index_dir, "words.json"), "w", encoding="utf-8") as f:
+            json.dump({"model": model_meta, "words": self.words}, f)
+
+    def load(self, index_dir, model_meta):
+        """
+        Load a saved index, memory-mapping the vectors. Returns False if missing or built for another model.
+        """
+        words_path = os.path.join(index_dir, "words.json")
+        vectors_path = os.path.join(index_dir, "vectors.npy")
+        if not (os.path.exists(words_path) and os.path.exists(vectors_path)):
+            return False
+
+        with open(words_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved["model"] != model_meta:
+            return False
+
+        self.words = saved["words"]
+        self.word_index = {word: idx for idx, word in enumerate(self.words)}
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        return True
+
+    def load_or_build(self, nlp, index_dir=DEFAULT_INDEX_DIR):
+        """
+        Load the persisted index for this spaCy pipeline, building and saving it on first use.
+        """
+        model_meta = {"name": nlp.meta.get("name"), "version": nlp.meta.get("version")}
+        if not self.load(index_dir, model_meta):
+            self.build(nlp.vocab)
+            self.save(index_dir, model_meta)
+        return self
+
+    def most_similar(self, word):
+        """
+        Top words by cosine similarity above the threshold, using one matrix-vector
+        product and argpartition.
+        """
+        idx = self.word_index.get(word)
+        if idx is None or not len(self.vectors):
+            return []
+
+        similarities = self.vectors @ self.vectors[idx]
+        similarities[idx] = -1  # Exclude the word itself
+        k = min(self.max_synonyms, len(similarities) - 1)
+        if k <= 0:
+            return []
+
+        candidates = np.argpartition(-similarities, k - 1)[:k]
+        candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+        return [self.words[i] for i in candidates if similarities[i] > self.threshold]
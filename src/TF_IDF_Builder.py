@@ -1,7 +1,12 @@
 from sklearn.feature_extraction.text import TfidfVectorizer
 from Document import Document
+from DocumentStore import DocumentStore
+from SnippetGenerator import SnippetGenerator
+from IndexStore import IndexStore
 import os
+import gzip
 import hashlib
+import itertools
 import xml.etree.ElementTree as ET
 import numpy as np
 
@@ -18,39 +23,54 @@ class TF_IDF_Builder:
                                           sublinear_tf=True,
                                           norm="l2",
                                           smooth_idf=True)
-        self.documents = []
+        self.documents = DocumentStore()  # Columnar store shared by all models, which only keep indices
         self.tfidf_matrix = None
+        self.snippets = SnippetGenerator()  # Shared, lazy snippet service for all models
 
     def generate_doc_id(self,filename):
         return hashlib.md5(filename.encode()).hexdigest()
 
     def load_cranfield_xml(self,filepath):
-        documents = []
-        
+        return list(self.iter_cranfield_xml(filepath))
+
+    def iter_cranfield_xml(self, filepath, chunk_size=1 << 16):
+        """
+        Stream the documents of a rootless Cranfield/TREC XML file (optionally gzipped) one at a time.
+        The file is fed to a pull parser in chunks inside a fake root, and every <doc> element is
+        cleared once read, so memory does not grow with the file size.
+        """
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                xml_content = f"<root>\n{f.read()}</root>"  # Wrap docs in a fake root
-
-            root = ET.fromstring(xml_content)  # Parse as a single XML structure
-
-            for doc in root.findall("doc"):
-                try:
-                    doc_id = doc.find("docno").text.strip()
-                    title = doc.find("title").text.strip() if doc.find("title").text is not None else ""
-                    author = doc.find("author").text.strip() if doc.find("author").text is not None else ""
-                    bib = doc.find("bib").text.strip() if doc.find("bib").text is not None else ""
-                    text = doc.find("text").text.strip() if doc.find("text").text is not None else ""
-
-                    documents.append({
-                        "doc_id": doc_id,
-                        "file_name": title,
-                        "author": author,
-                        "bibliography": bib,
-                        "text": text
-                    })
-
-                except AttributeError as e:
-                    print(f"Skipping a document due to missing fields: {e}")
+            opener = gzip.open if filepath.endswith(".gz") else open
+            with opener(filepath, "rt", encoding="utf-8") as f:
+                parser = ET.XMLPullParser(events=("start", "end"))
+                parser.feed("<root>\n")  # Wrap docs in a fake root
+                root = None
+
+                for chunk in itertools.chain(iter(lambda: f.read(chunk_size), ""), ["</root>"]):
+                    parser.feed(chunk)
+                    for event, element in parser.read_events():
+                        if root is None:
+                            root = element
+                        if event != "end" or element.tag != "doc":
+                            continue
+                        try:
+                            doc_id = element.find("docno").text.strip()
+                            title = element.find("title").text.strip() if element.find("title").text is not None else ""
+                            author = element.find("author").text.strip() if element.find("author").text is not None else ""
+                            bib = element.find("bib").text.strip() if element.find("bib").text is not None else ""
+                            text = element.find("text").text.strip() if element.find("text").text is not None else ""
+
+                            yield {
+                                "doc_id": doc_id,
+                                "file_name": title,
+                                "author": author,
+                                "bibliography": bib,
+                                "text": text
+                            }
+
+                        except AttributeError as e:
+                            print(f"Skipping a document due to missing fields: {e}")
+                        root.clear()  # Drop the parsed document
 
         except FileNotFoundError:
             print(f"Error: File {filepath} not found.")
@@ -59,15 +79,11 @@ class TF_IDF_Builder:
         except Exception as e:
             print(f"Unexpected Error: {e}")
 
-        return documents
-    def load_documents(self, folder_path):
+    def iter_documents(self, folder_path):
         """
-        Load all .txt documents from the given folder, preprocess them,
-        and store their content in the `documents` list.
+        Stream Document objects from every cran.all* shard in the folder (plain or .gz), in file name order.
         """
-
-        self.documents = []
-        for idx, file in enumerate(os.listdir(folder_path)):
+        for file in sorted(os.listdir(folder_path)):
             file_path = os.path.join(folder_path, file)
             # Check if the file is a .txt file and if it exists
             """if os.path.isfile(file_path) and file.endswith(".txt"):
@@ -80,23 +96,39 @@ class TF_IDF_Builder:
                     self.documents.append(document)"""
             # Or read and parse a Cranfield collection in TREC XML format
             if os.path.isfile(file_path) and file.startswith("cran.all"):
-                documents = self.load_cranfield_xml(file_path)
-                for doc in documents:
+                for doc in self.iter_cranfield_xml(file_path):
                     #preprocessed_text = self.preprocessor.preprocess(doc["text"])
                     #combine text, title, author, and bib and store in preprocessed_text
                     preprocessed_text = doc["text"]
-                    document = Document(doc["doc_id"], doc["file_name"], file_path, doc["text"], preprocessed_text, ".xml",
-                                        author=doc["author"], bibliography=doc["bibliography"])
-                    self.documents.append(document)
+                    yield Document(doc["doc_id"], doc["file_name"], file_path, doc["text"], preprocessed_text, ".xml",
+                                   author=doc["author"], bibliography=doc["bibliography"])
+
+    def load_documents(self, folder_path):
+        """
+        Load all .txt documents from the given folder, preprocess them,
+        and store their content in the `documents` list.
+        """
+
+        self.documents = DocumentStore(self.iter_documents(folder_path))
             
         if not self.documents:
             raise ValueError("No .txt files found in the specified folder.")
+
+        self.snippets.build(self.documents)
         return self.documents
 
-    def build_index(self, documents):
+    def add_documents(self, documents):
+        """
+        Append documents to the collection without refitting.
+        :return: Indices of the added documents.
+        """
+        return self.documents.extend(documents)
+
+    def build_index(self, documents, doc_sentences=None):
         """
         Build the TF-IDF index for the loaded documents.
         Complete pipeline: TF-IDF → EVSM → LSA
+        :param doc_sentences: Sentences per document (defaults to each document's `sentences`).
         """
         if not self.documents:
             raise ValueError("No documents loaded. Use `load_documents()` first.")
@@ -109,12 +141,55 @@ class TF_IDF_Builder:
         self.doc_mapping = []  # Track which sentence belongs to which document
 
         for doc_id, doc in enumerate(documents):
-            self.sentences.extend(doc.sentences)  # Flatten the list of sentences
-            self.doc_mapping.extend([doc_id] * len(doc.sentences))  # Map sentences to document IDs
+            sentences = doc.sentences if doc_sentences is None else doc_sentences[doc_id]
+            self.sentences.extend(sentences)  # Flatten the list of sentences
+            self.doc_mapping.extend([doc_id] * len(sentences))  # Map sentences to document IDs
         
         # Compute TF-IDF at sentence level
         self.tfidf_matrix = self.vectorizer.fit_transform(self.sentences)
 
+    def append_sentences(self, sentences, doc_mapping):
+        """
+        Record sentences folded into the index after fitting (they have no TF-IDF rows),
+        so the saved sentences always cover the whole collection.
+        :param doc_mapping: Document index of every sentence.
+        """
+        if not isinstance(self.sentences, list):
+            self.sentences = list(self.sentences)  # Sentences loaded from disk are read-only
+        self.sentences.extend(sentences)
+        self.doc_mapping.extend(doc_mapping)
+
+    def save(self, index_dir):
+        """
+        Save the documents, sentences, fitted vocabulary/IDF and TF-IDF matrix to an index directory.
+        """
+        store = IndexStore(index_dir)
+        self.documents.save(index_dir)
+        store.save_strings("sentences", self.sentences)
+        store.save_array("doc_mapping", np.array(self.doc_mapping, dtype=np.int64))
+
+        terms = sorted(self.vectorizer.vocabulary_, key=self.vectorizer.vocabulary_.get)
+        store.save_json("vocabulary", terms)
+        store.save_array("idf", self.vectorizer.idf_)
+        store.save_csr("tfidf", self.tfidf_matrix)
+
+    def load(self, index_dir):
+        """
+        Restore a saved TF-IDF index without refitting the vectorizer.
+        :return: The loaded documents.
+        """
+        store = IndexStore(index_dir)
+        self.documents = DocumentStore.open(index_dir)  # Texts stay on disk
+        self.sentences = store.load_strings("sentences")  # Decoded only when refitting
+        self.doc_mapping = store.load_array("doc_mapping").tolist()
+
+        terms = store.load_json("vocabulary")
+        self.vectorizer.vocabulary_ = {term: idx for idx, term in enumerate(terms)}
+        self.vectorizer.idf_ = np.asarray(store.load_array("idf"))
+        self.tfidf_matrix = store.load_csr("tfidf")
+
+        self.snippets.build(self.documents)
+        return self.documents
         
     def get_query_vector(self, query):
         """
@@ -122,6 +197,12 @@ class TF_IDF_Builder:
         """
         return self.vectorizer.transform([query])
 
+    def get_query_matrix(self, queries):
+        """
+        Transform several queries at once into a sparse queries x terms TF-IDF matrix.
+        """
+        return self.vectorizer.transform(queries)
+
     def get_tfidf_matrix(self):
         """
         Retrieve the TF-IDF matrix after building the index.
@@ -1,30 +1,51 @@
 import nltk
+import re
+from functools import lru_cache
 from nltk.tokenize import word_tokenize, TreebankWordTokenizer,PunktTokenizer
 from nltk.corpus import stopwords, wordnet
+from nltk.corpus.reader.wordnet import ADJ, ADV, NOUN, VERB
 from nltk.stem import PorterStemmer, WordNetLemmatizer
 import spacy
 from nltk.util import ngrams
 from   symspellpy  import SymSpell, Verbosity  # symspellpy forSpelling Correction
 import pkg_resources
 from gensim.models.phrases import Phrases, Phraser  # For n-gram formation
-from textblob import TextBlob   # textblob for PoS tagging
+from SynonymIndex import SynonymIndex
 
 nltk.download('punkt')
 nltk.download('punkt_tab')
 nltk.download('stopwords')
 nltk.download("wordnet")
+nltk.download("averaged_perceptron_tagger_eng")  # PoS tagging for lemmatization
 
 
 
 # Load spaCy model for semantic similarity
 nlp = spacy.load("en_core_web_sm")
 
+# Penn Treebank tag prefix -> WordNet part of speech
+WORDNET_POS = {"J": ADJ, "N": NOUN, "R": ADV, "V": VERB}
+
 class TextPreprocessor:
-    def __init__(self):
+    def __init__(self, lemma_cache_size=100000, synonym_cache_size=50000):
+        """
+        :param lemma_cache_size: Maximum number of (word, PoS) -> lemma entries kept in the LRU cache.
+        :param synonym_cache_size: Maximum number of words whose synonym expansion is cached.
+        """
         self.stop_words = set(stopwords.words('english'))
         self.stemmer = PorterStemmer()
         self.lemmatizer = WordNetLemmatizer()
         self.max_synonyms = 3
+        self.sentence_tokenizer = PunktTokenizer()
+        self.word_tokenizer = TreebankWordTokenizer()
+
+        # (word, PoS) -> lemma, shared across all documents and queries
+        self.lemmatize = lru_cache(maxsize=lemma_cache_size)(self._lemmatize)
+
+        # Nearest-neighbour index over the spaCy vectors, persisted and memory-mapped after the first run
+        self.synonym_index = SynonymIndex(self.max_synonyms).load_or_build(nlp)
+        self.get_wordnet_synonyms = lru_cache(maxsize=synonym_cache_size)(self._get_wordnet_synonyms)
+        self.synonym_expansion = lru_cache(maxsize=synonym_cache_size)(self._synonym_expansion)
 
         #Based on notebook by https://github.com/mdsharique/Information-Retrieval/blob/master/IR.ipynb
         self.sym_spell       = SymSpell(max_dictionary_edit_distance = 2, prefix_length = 7)     # Creating a Spell correction Object
@@ -34,6 +55,12 @@ class TextPreprocessor:
         self.sym_spell.load_dictionary(dictionary_path, term_index = 0, count_index = 1)         # Loading the Unigram Dictionary
         self.sym_spell.load_bigram_dictionary(bigram_path, term_index = 0, count_index = 2)      # Loading the Bigram  Dictionary
 
+        # NER only needs the "ner" component (and tok2vec if it listens to it)
+        ner_pipes = {"ner"}
+        if "tok2vec" in nlp.pipe_names and "ner" in nlp.get_pipe("tok2vec").listening_components:
+            ner_pipes.add("tok2vec")
+        self.ner_disabled_pipes = [name for name in nlp.pipe_names if name not in ner_pipes]
+
         ##------Stop Word Model-----##
         spacy_nlp       = spacy.load('en_core_web_sm')                                      # Loading the model of StopWord removal
         self.spacy_stopwords = spacy.lang.en.stop_words.STOP_WORDS                               # Storing list of stopwords: https://raw.githubusercontent.com/explosion/spaCy/master/spacy/lang/en/stop_words.py
@@ -48,8 +75,7 @@ class TextPreprocessor:
             input:      Takes a string
             output:     Returns a list of separate sentence strings
         """
-        tokenizer = PunktTokenizer()
-        segmentedText = tokenizer.tokenize(text.strip())                  # Tokenize the document into sentences
+        segmentedText = self.sentence_tokenizer.tokenize(text.strip())    # Tokenize the document into sentences
         return segmentedText
 
     def clean_text(self,text,ngram_cond = False):
@@ -66,7 +92,7 @@ class TextPreprocessor:
 
         for sentence in text:
             #sentence    = self.sym_spell.lookup_compound(sentence, max_edit_distance = MAX_EDIT_DIST)[0].term    # Spelling Correction
-            token_words = TreebankWordTokenizer().tokenize(sentence)    
+            token_words = self.word_tokenizer.tokenize(sentence)    
             token_words = [word for word in token_words if (word.isalnum() and word.isalpha())]             # Only considering tokens with ALPHABETS
             token_words = [word for word in token_words if word not in self.spacy_stopwords] 
             tokenizedText.append(token_words)  
@@ -74,35 +100,40 @@ class TextPreprocessor:
 
         return tokenizedText
     
+    def _lemmatize(self, word, pos=NOUN):
+        return self.lemmatizer.lemmatize(word, pos=pos)
+
+    def lemma_cache_info(self):
+        """Hit/miss statistics of the shared lemma cache."""
+        return self.lemmatize.cache_info()
+
     def lemmatization(self,text):
         """
         Function for word lemmatization.
+        Each sentence is PoS-tagged in a single call and lemmas are looked up in the shared LRU cache.
         INPUT       :   Takes a list of sentences which is a list of tokenis for a document
         OUTPUT      :   Returns a list of sentences which is a list of lemmataized tokens for a document
         """
         reducedText = []                    # Empty list for storing sentences of lemmatized words
-        lemmatizer = WordNetLemmatizer()    # Creating a WordNet lemmatization object
 
         for tokens in text:
-            lem_word = []
+            # n-gram entries are represented by their first word; entries without a word are dropped
+            entries = []
             for word in tokens:
-                pos_tag = TextBlob(word)
-                if (pos_tag.tags):
-                    if   (pos_tag.tags[0][1][0] == 'J'):
-                        lem_word.append(lemmatizer.lemmatize(pos_tag.tags[0][0], pos = wordnet.ADJ ))
-                    elif (pos_tag.tags[0][1][0] == 'N'):
-                        lem_word.append(lemmatizer.lemmatize(pos_tag.tags[0][0], pos = wordnet.NOUN))
-                    elif (pos_tag.tags[0][1][0] == 'R'):
-                        lem_word.append(lemmatizer.lemmatize(pos_tag.tags[0][0], pos = wordnet.ADV ))
-                    elif (pos_tag.tags[0][1][0] == 'V'):
-                        lem_word.append(lemmatizer.lemmatize(pos_tag.tags[0][0], pos = wordnet.VERB))
-                    else:
-                        lem_word.append(word)
+                head = re.search(r"\w+", word)
+                if head:
+                    entries.append((word, head.group()))
+
+            lem_word = []
+            tags = nltk.pos_tag([head for _, head in entries]) if entries else []
+            for (word, head), (_, tag) in zip(entries, tags):
+                pos = WORDNET_POS.get(tag[0])
+                lem_word.append(self.lemmatize(head, pos) if pos else word)
 
             reducedText.append(lem_word)
         return reducedText
 
-    def get_wordnet_synonyms(self, word):
+    def _get_wordnet_synonyms(self, word):
         """Fetch synonyms from WordNet."""
         synonyms = set()
         for syn in wordnet.synsets(word):
@@ -112,17 +143,9 @@ class TextPreprocessor:
 
     def get_spacy_synonyms(self, word):
         """Find semantically similar words using spaCy word vectors."""
-        word_token = str(word)
-        similar_words = []
-        for candidate in nlp.vocab:
-            if candidate.is_alpha and candidate.has_vector:  # Filter valid words
-                similarity = word_token.similarity(nlp(candidate.text))
-                if similarity > 0.6:  # Only include words with strong similarity
-                    similar_words.append((candidate.text, similarity))
-        similar_words.sort(key=lambda x: x[1], reverse=True)
-        return [word[0] for word in similar_words[: self.max_synonyms]]
-
-    def synonym_expansion(self, word):
+        return self.synonym_index.most_similar(str(word))
+
+    def _synonym_expansion(self, word):
         """Expand words with synonyms using WordNet and spaCy."""
         synonyms = set()
         synonyms.update(self.get_wordnet_synonyms(word))
@@ -134,10 +157,21 @@ class TextPreprocessor:
     
     def extract_named_entities(self, text):
         """Extract named entities from text using spaCy's NER."""
-        doc = nlp(text)
+        doc = nlp(text, disable=self.ner_disabled_pipes)
         entities = [ent.text for ent in doc.ents]
         return entities
 
+    def extract_named_entities_batch(self, texts, batch_size=64, n_process=1):
+        """
+        Extract named entities from many texts at once with spaCy's nlp.pipe.
+        Components NER does not need are disabled.
+        :param batch_size: Number of texts per spaCy batch.
+        :param n_process: Number of worker processes used by spaCy.
+        :return: List of entity lists, aligned with texts.
+        """
+        docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=self.ner_disabled_pipes)
+        return [[ent.text for ent in doc.ents] for doc in docs]
+
 
     def generate_ngrams(self,text, n=2):
         tokens = text.split()
@@ -3,71 +3,215 @@ import itertools
 from sklearn.metrics.pairwise import cosine_similarity
 from TextPreprocessor import TextPreprocessor
 import numpy as np
+import scipy.sparse as sp
 from sklearn.decomposition import TruncatedSVD
-import copy
+from DocumentAnalyzer import DocumentAnalyzer
+from IndexStore import IndexStore
+from ScoreFusion import rank_scores
+from Instrumentation import instrumentation
 
 class VectorSpaceModel:
-    def __init__(self, tfidf_builder, trec):
+    def __init__(self, tfidf_builder, trec, tdw_chunk_size=None, refit_threshold=0.2):
         """
         Initialize the Vector Space Model.
         :param tfidf_builder: An instance of the TF_IDF_Builder class.
         :param trec: Instance for handling TREC-style evaluation.
+        :param tdw_chunk_size: Number of TF-IDF rows processed at a time when computing TDW (None = all at once).
+        :param refit_threshold: Fraction of documents added or removed since the last fit that triggers a full refit.
         """
         self.preprocessor = tfidf_builder.preprocessor
         self.tfidf_builder = tfidf_builder
         self.tfidf_matrix = None
         self.trec = trec
-        self.svd = TruncatedSVD(n_components=300)  # LSA component
+        self.svd = TruncatedSVD(n_components=300, random_state=0)  # LSA component, fixed seed for reproducible builds
         self.evsm_matrix = None
         self.lsa_matrix = None
         self.tdw = None
-        self.documents = None
-        self.sentence_doc_map = {}  # Map sentence index → document
-        self.sentences = []  # Store segmented sentences
+        self.tdw_chunk_size = tdw_chunk_size
+        self.sentence_doc_map = None  # Array: sentence index → document index
+        self.sentence_starts = None  # Index of the first sentence of every document with sentences
+        self.doc_sentences = []  # Sentences per document ([] for removed documents); None until needed after load
+        self.active = None  # False for removed documents
+        self.refit_threshold = refit_threshold
+        self.staleness = 0  # Documents added or removed since TF-IDF, TDW and LSA were fitted
 
-    def build_index(self, documents):
+    def build_index(self, documents, analyses=None):
         """
         Preprocess documents, perform segmentation and tokenization, and build the TF-IDF index.
+        :param analyses: Shared DocumentAnalysis per document (computed here if not given).
         """
         if not documents:
             raise ValueError("No documents loaded. Use `load_documents()` first.")
         
-        self.documents = copy.deepcopy(documents)
-
-        for doc_idx, doc in enumerate(self.documents):
-            doc.preprocessed_text = self.preprocess_vsm(doc)  # Preprocess the document
-            
-            for sentence in doc.preprocessed_text:
-                sentence = " ".join(sentence)
-                self.sentence_doc_map[len(self.sentences)] = doc  # Link sentence to document
-                self.sentences.append(sentence)
-                doc.sentences.append(sentence)  # Store sentence-level text
-
-        # Build TF-IDF only at the document level
-        self.tfidf_builder.build_index(self.documents)
+        if analyses is None:
+            analyses = DocumentAnalyzer(self.preprocessor).analyze_all(documents)
+
+        self.doc_sentences = [self.sentence_texts(analysis) for analysis in analyses]
+        self.active = np.ones(len(analyses), dtype=bool)
+        self.fit()
+
+    def sentence_texts(self, analysis):
+        return [" ".join(sentence) for sentence in self.preprocess_vsm(analysis)]
+
+    def fit(self):
+        """
+        Fit TF-IDF, TDW and LSA on the sentences of all current documents.
+        """
+        sentence_doc_map = []
+
+        for doc_idx, sentences in enumerate(self.document_sentences()):
+            sentence_doc_map.extend([doc_idx] * len(sentences))  # Link sentences to document
+
+        # Sentences of a document are contiguous, so documents are segments of this array
+        self.sentence_doc_map = np.array(sentence_doc_map, dtype=np.int64)
+        self.sentence_starts = np.flatnonzero(np.diff(self.sentence_doc_map, prepend=-1))
+
+        # Build TF-IDF only at the document level; the builder keeps the (flattened) sentences
+        self.tfidf_builder.build_index(self.tfidf_builder.documents, self.doc_sentences)
         self.tfidf_matrix = self.tfidf_builder.get_tfidf_matrix()
 
         # Compute Term Discrimination Weights (TDW)
         self.compute_tdw()
         self.apply_evsm_weights()
         self.apply_lsa()
+        self.staleness = 0
 
-    def preprocess_vsm(self, doc):
+    def add_documents(self, documents, analyses=None):
         """
-        Perform segmentation and tokenization on a document.
+        Add documents after the existing ones (add them to the TF-IDF builder's
+        document store first). Their sentences are folded into the
+        existing LSA space with the fitted TF-IDF, TDW and TruncatedSVD projection;
+        once refit_threshold of the collection has changed, everything is refitted.
+        :param analyses: Shared DocumentAnalysis per new document (computed here if not given).
         """
-        text = doc.original_text
-        text = self.preprocessor.case_insensitive(text)  # Convert to lowercase
-        sentences = self.preprocessor.punkt_tokenize(text)  # Sentence segmentation
-        cleaned = self.preprocessor.clean_text(sentences,True)
-        processed_sentences = self.preprocessor.lemmatization(cleaned)
-        processed_sentences.extend(self.preprocessor.extract_named_entities(text)) 
-        doc.preprocessed_text = processed_sentences
+        if analyses is None:
+            analyses = DocumentAnalyzer(self.preprocessor).analyze_all(documents)
+
+        first_doc_idx = len(self.active)
+        doc_sentences = [self.sentence_texts(analysis) for analysis in analyses]
+        self.document_sentences().extend(doc_sentences)
+        self.active = np.concatenate([self.active, np.ones(len(doc_sentences), dtype=bool)])
+
+        self.staleness += len(doc_sentences)
+        if self.staleness > self.refit_threshold * len(self.active):
+            self.fit()
+            return
+
+        sentences = [sentence for doc in doc_sentences for sentence in doc]
+        if not sentences:
+            return
+        sentence_doc_map = np.repeat(np.arange(first_doc_idx, len(self.active)),
+                                     [len(doc) for doc in doc_sentences])
+
+        # Fold-in: same TF-IDF → EVSM → LSA pipeline, without refitting
+        tfidf = self.tfidf_builder.vectorizer.transform(sentences)
+        lsa = self.svd.transform(tfidf.multiply(self.tdw))
+
+        self.sentence_starts = np.concatenate([
+            self.sentence_starts,
+            len(self.sentence_doc_map) + np.flatnonzero(np.diff(sentence_doc_map, prepend=-1))
+        ])
+        self.sentence_doc_map = np.concatenate([self.sentence_doc_map, sentence_doc_map])
+        self.lsa_matrix = np.vstack([self.lsa_matrix, lsa])
+        self.tfidf_builder.append_sentences(sentences, sentence_doc_map.tolist())
+
+    def remove_documents(self, doc_indices):
+        """
+        Remove documents from the rankings. Their sentences stay in the LSA matrix
+        until the next refit; indices of the remaining documents do not change.
+        """
+        doc_indices = [doc_idx for doc_idx in set(doc_indices) if self.active[doc_idx]]
+        for doc_idx in doc_indices:
+            self.active[doc_idx] = False
+            if self.doc_sentences is not None:
+                self.doc_sentences[doc_idx] = []
+
+        self.staleness += len(doc_indices)
+        if self.staleness > self.refit_threshold * len(self.active):
+            self.fit()
+
+    def save(self, index_dir):
+        """
+        Save TDW, the fitted LSA projection and the sentence-level LSA matrix.
+        The TF-IDF matrix and the sentences are saved by TF_IDF_Builder.save.
+        """
+        store = IndexStore(index_dir)
+        store.save_array("active", self.active)
+        store.save_json("state", {"staleness": self.staleness})
+        store.save_array("tdw", self.tdw)
+        store.save_array("lsa_matrix", self.lsa_matrix)
+        store.save_array("sentence_doc_map", self.sentence_doc_map)
+        store.save_array("sentence_starts", self.sentence_starts)
+        for attribute in ("components_", "explained_variance_", "explained_variance_ratio_", "singular_values_"):
+            store.save_array("svd." + attribute, getattr(self.svd, attribute))
+
+    def load(self, index_dir):
+        """
+        Restore a saved VSM index; the TF-IDF builder must be loaded first.
+        """
+        store = IndexStore(index_dir)
+        self.active = np.array(store.load_array("active"))
+        self.staleness = store.load_json("state")["staleness"]
+        self.tfidf_matrix = self.tfidf_builder.get_tfidf_matrix()
+
+        self.tdw = np.asarray(store.load_array("tdw"))
+        self.lsa_matrix = store.load_array("lsa_matrix")
+        self.sentence_doc_map = store.load_array("sentence_doc_map")
+        self.sentence_starts = store.load_array("sentence_starts")
+        for attribute in ("components_", "explained_variance_", "explained_variance_ratio_", "singular_values_"):
+            setattr(self.svd, attribute, store.load_array("svd." + attribute))
+        self.svd.n_features_in_ = self.svd.components_.shape[1]
+
+        self.doc_sentences = None  # Rebuilt from the builder's sentences once documents change
+        self.apply_evsm_weights()
+
+    def document_sentences(self):
+        """
+        Sentences per document, needed to refit after documents are added or removed.
+        After load they are grouped from the TF-IDF builder's sentences on first use.
+        """
+        if self.doc_sentences is None:
+            self.doc_sentences = [[] for _ in range(len(self.active))]
+            for sentence, doc_idx in zip(self.tfidf_builder.sentences, self.sentence_doc_map.tolist()):
+                if self.active[doc_idx]:
+                    self.doc_sentences[doc_idx].append(sentence)
+        return self.doc_sentences
+
+    def preprocess_vsm(self, analysis):
+        """
+        Sentence tokens of a document from its shared analysis (segmented, cleaned and lemmatized).
+        """
+        processed_sentences = list(analysis.sentences)
+        processed_sentences.extend(analysis.entities)
         return processed_sentences  # Returns a list of tokenized sentences
 
     def compute_tdw(self):
-        """Compute Term Discrimination Weight (TDW)"""
-        term_variances = np.var(self.tfidf_matrix.toarray(), axis=0)
+        """
+        Compute Term Discrimination Weight (TDW) as the per-term standard deviation.
+        Works on the nonzeros of the sparse TF-IDF matrix, optionally in row chunks,
+        so memory scales with nnz rather than sentences x vocabulary.
+        """
+        matrix = self.tfidf_matrix.tocsr()
+        n_rows, n_terms = matrix.shape
+        chunk_size = self.tdw_chunk_size or max(n_rows, 1)
+
+        # First pass: E[x] per term (zeros contribute nothing to the sum)
+        term_sums = np.zeros(n_terms)
+        term_nonzeros = np.zeros(n_terms)
+        for start in range(0, n_rows, chunk_size):
+            chunk = matrix[start:start + chunk_size]
+            term_sums += np.bincount(chunk.indices, weights=chunk.data, minlength=n_terms)
+            term_nonzeros += np.bincount(chunk.indices, minlength=n_terms)
+        term_means = term_sums / n_rows
+
+        # Second pass: E[(x - E[x])^2], every implicit zero adds E[x]^2
+        squared_deviations = (n_rows - term_nonzeros) * term_means ** 2
+        for start in range(0, n_rows, chunk_size):
+            chunk = matrix[start:start + chunk_size]
+            deviations = chunk.data - term_means[chunk.indices]
+            squared_deviations += np.bincount(chunk.indices, weights=deviations ** 2, minlength=n_terms)
+
+        term_variances = squared_deviations / n_rows
         self.tdw = np.sqrt(term_variances)  # TDW based on variance
 
     def apply_evsm_weights(self):
@@ -87,77 +231,123 @@ class VectorSpaceModel:
         cleaned = self.preprocessor.clean_text(sentences,False)
         processed_sentence = self.preprocessor.lemmatization(cleaned)
 
-        processed_sentence.extend([self.preprocessor.synonym_expansion(word) for word in processed_sentence[0]])  # Can improve query recall
+        with instrumentation.stage("vsm.synonym_expansion"):
+            processed_sentence.extend([self.preprocessor.synonym_expansion(word) for word in processed_sentence[0]])  # Can improve query recall
 
         return " ".join(processed_sentence[0])
 
-    def search(self, query):
+    def score_vector(self, query):
         """
-        Search for the query in the document collection using VSM with optional PRF.
+        Document scores as an array aligned with the document indices, NaN for documents
+        without a positive score (not retrieved). The query text is replaced by its preprocessed form.
         """
         if self.tfidf_matrix is None:
             raise ValueError("TF-IDF index not built. Load documents and build the index first.")
         
-        query.query_name = self.preprocess_query(query.query_name)  # Preprocess query
-        query_vector = self.transform_query(query.query_name)  
+        with instrumentation.stage("vsm.preprocess"):
+            query.query_name = self.preprocess_query(query.query_name)  # Preprocess query
+
+        with instrumentation.stage("vsm.score"):
+            query_vector = self.transform_query(query.query_name)
+            similarities = cosine_similarity(query_vector, self.lsa_matrix).flatten()
+            doc_scores = self.aggregate_sentence_scores(similarities)
+            doc_scores[doc_scores <= 0] = np.nan
+        return doc_scores
+
+    def score_matrix(self, queries):
+        """
+        Scores of several queries at once (one row per query, as score_vector): the queries are
+        projected into the LSA space together and compared with every sentence in one matrix product.
+        """
+        if self.tfidf_matrix is None:
+            raise ValueError("TF-IDF index not built. Load documents and build the index first.")
+        if not queries:
+            return np.zeros((0, len(self.active)))
 
-        similarities = cosine_similarity(query_vector, self.lsa_matrix).flatten()
-        ranked_indices = similarities.argsort()[::-1]
+        with instrumentation.stage("vsm.preprocess"):
+            for query in queries:
+                query.query_name = self.preprocess_query(query.query_name)  # Preprocess query
+
+        with instrumentation.stage("vsm.score"):
+            query_lsa = self.transform_queries([query.query_name for query in queries])
+            similarities = cosine_similarity(query_lsa, self.lsa_matrix)
+            doc_scores = self.aggregate_sentence_scores(similarities)
+            doc_scores[doc_scores <= 0] = np.nan
+        return doc_scores
+
+    def build_results(self, query, scores, k=None):
+        """
+        Ranked results (document index, doc id, score, snippet) from a score vector.
+        """
+        with instrumentation.stage("vsm.sort"):
+            ranked_indices = rank_scores(scores, k)
+        instrumentation.count("vsm.results", len(ranked_indices))
 
         all_results = []
-        docs_added = []
         for idx in ranked_indices:
-            score = similarities[idx]
-            if score > 0:
-                doc = self.sentence_doc_map[idx]
-                snippet = self.generate_snippet(doc.original_text, query.query_name.split())
-                #Append to all_results if doc_id is not already in all_results using boolean array
-                if doc.doc_id not in docs_added:
-                    all_results.append({
-                        "doc_id": doc.doc_id,
-                        "file_name": doc.file_name,
-                        "original_text": doc.original_text,
-                        "preprocessed_text": doc.preprocessed_text,
-                        "path": doc.path,
-                        "score": score,
-                        "snippet": snippet,
-                        "extension": doc.file_extension,
-                        "bibliography": doc.bibliography,
-                        "author": doc.author
-                    })
-                    docs_added.append(doc.doc_id)
-
-        self.trec.save_to_trec(query, all_results)
+            snippet = self.tfidf_builder.snippets.lazy(idx, query.query_name.split())
+            # Metadata and text are read from the document store only when displayed
+            all_results.append({
+                "doc_idx": int(idx),
+                "doc_id": self.tfidf_builder.documents.doc_ids[idx],
+                "score": float(scores[idx]),
+                "snippet": snippet
+            })
+        return all_results
+
+    def results_from_scores(self, query, scores, k=None):
+        """
+        Ranked results from a score vector, saved to the TREC run.
+        """
+        all_results = self.build_results(query, scores, k)
+        with instrumentation.stage("vsm.save_to_trec"):
+            self.trec.save_to_trec(query, all_results)
 
         return all_results
 
+    def search(self, query, k=None):
+        """
+        Search for the query in the document collection using VSM with optional PRF.
+        :param k: Number of documents to return (None returns every document with a positive score).
+        """
+        with instrumentation.trace("vsm.search", query.query_name):
+            return self.results_from_scores(query, self.score_vector(query), k)
+
+    def search_batch(self, queries, k=None):
+        """
+        Search for several queries at once; returns the results of each query, in order.
+        Nothing is saved to the TREC run (see BatchRunner for batch run files).
+        """
+        return [self.build_results(query, scores, k) for query, scores in zip(queries, self.score_matrix(queries))]
+
+    def aggregate_sentence_scores(self, similarities):
+        """
+        Max-pool sentence similarities into one score per document with a segment reduction
+        (along the last axis, so a queries x sentences matrix gives queries x documents).
+        Documents without sentences and removed documents score 0.
+        """
+        doc_scores = np.zeros(similarities.shape[:-1] + (len(self.active),))
+        if len(self.sentence_starts):
+            doc_scores[..., self.sentence_doc_map[self.sentence_starts]] = np.maximum.reduceat(
+                similarities, self.sentence_starts, axis=-1)
+        doc_scores[..., ~self.active] = 0  # Removed documents are never ranked
+        return doc_scores
+
     def transform_query(self, query):
         """
         Transform a query using the same pipeline (TF-IDF → EVSM → LSA), but with short-query weighting.
         """
-        query_tfidf = self.tfidf_builder.get_query_vector(query)
-        query_length = len(query.split())
-        query_weight_factor = 1.0 if query_length > 3 else 1.5  # Boost short queries
+        return self.transform_queries([query])
 
-        query_evsm = query_tfidf.multiply(self.tdw * query_weight_factor)
+    def transform_queries(self, queries):
+        """
+        Transform several queries at once: one sparse queries x terms TF-IDF matrix and one LSA projection.
+        """
+        query_tfidf = self.tfidf_builder.get_query_matrix(queries)
+        query_weight_factors = np.array([1.0 if len(query.split()) > 3 else 1.5 for query in queries])  # Boost short queries
+
+        # Row scaling by a sparse diagonal keeps every intermediate sparse (no dense queries x terms array)
+        query_evsm = sp.diags(query_weight_factors) @ query_tfidf.multiply(self.tdw)
         query_lsa = self.svd.transform(query_evsm)
 
         return query_lsa
-
-    def generate_snippet(self, content, query_terms, snippet_length=30):
-        """
-        Generate a snippet from the document containing the query terms,
-        with surrounding context and highlighted terms.
-        """
-        tokens = content.split()
-        query_terms_lower = [term.lower() for term in query_terms]
-        query_indices = [i for i, token in enumerate(tokens) if token.lower() in query_terms_lower]
-        
-        if not query_indices:
-            return "No relevant snippet found."
-        
-        start_index = max(0, query_indices[0] - snippet_length // 2)
-        end_index = min(len(tokens), query_indices[0] + snippet_length // 2)
-        
-        snippet = " ".join(tokens[start_index:end_index])
-        return snippet + "..." if end_index < len(tokens) else snippet
\ No newline at end of file
@@ -21,18 +21,33 @@ class IconLoadUtilities:
         return ImageTk.PhotoImage(img)
 
 class TRECUtilities:
-    def __init__(self, output_path="output.trec"):
+    def __init__(self, output_path="output.trec", clear=True, depth=100):
+        """
+        :param clear: Clear the file upon initialization.
+        :param depth: Results saved per query.
+        """
         self.query = None
         self.output_path = "trec_eval-main/results_testing/"+output_path
+        self.depth = depth
 
         # Clear the file upon initialization
-        open(self.output_path, "w").close()
+        if clear:
+            open(self.output_path, "w").close()
+
+    def trec_lines(self, query_id, results):
+        for i, result in enumerate(results[:self.depth]):
+            # query_id iter document_id rank similarity run_id
+            yield f"{query_id} Q0 {result['doc_id']} {i + 1} {result['score']} STANDARD\n"
 
     def save_to_trec(self, query, results):
         with open(self.output_path, "a") as f:  # Append mode
-            for i, result in enumerate(results[:100]):
-                # query_id iter document_id rank similarity run_id
-                f.write(f"{query.query_id} Q0 {result['doc_id']} {i + 1} {result['score']} STANDARD\n")
+            f.writelines(self.trec_lines(query.query_id, results))
 
-    
-        
\ No newline at end of file
+    def save_run(self, run):
+        """
+        Write a whole run at once through a single buffered writer, replacing the file.
+        :param run: Iterable of (query id, results) in query order.
+        """
+        with open(self.output_path, "w", buffering=1 << 20) as f:
+            for query_id, results in run:
+                f.writelines(self.trec_lines(query_id, results))
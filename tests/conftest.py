@@ -0,0 +1,102 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from Document import Document  # noqa: E402
+
+
+class ToyPreprocessor:
+    """
+    Deterministic stand-in for TextPreprocessor on toy corpora: words are kept as they
+    are (no lemmatization, entities or synonyms), so expected scores can be computed by hand.
+    """
+    stop_words = set()
+
+    def case_insensitive(self, text):
+        return text.lower()
+
+    def lemmatize(self, word):
+        return word
+
+    def extract_named_entities(self, text):
+        return []
+
+    def extract_named_entities_batch(self, texts, batch_size=64, n_process=1):
+        return [[] for _ in texts]
+
+    def punkt_tokenize(self, text):
+        return [sentence.strip() for sentence in text.split(".") if sentence.strip()]
+
+    def clean_text(self, sentences, ngram_cond=False):
+        return [sentence.split() for sentence in sentences]
+
+    def lemmatization(self, sentences):
+        return [list(tokens) for tokens in sentences]
+
+    def synonym_expansion(self, word):
+        return ""
+
+
+class NullRun:
+    """
+    TREC run writer that discards the results (the real one writes into trec_eval-main).
+    """
+    def save_to_trec(self, query, results):
+        pass
+
+
+def make_documents(count, vocabulary_size=40, seed=0, first_id=0):
+    """
+    Random documents over the terms t0..t<vocabulary_size - 1>, one to three sentences each.
+    """
+    rnd = random.Random(seed)
+    terms = ["t%d" % i for i in range(vocabulary_size)]
+    documents = []
+    for doc_id in range(first_id, first_id + count):
+        text = ". ".join(" ".join(rnd.choices(terms, k=rnd.randint(2, 10))) for _ in range(rnd.randint(1, 3)))
+        documents.append(Document(str(doc_id), "doc%d.xml" % doc_id, "", text, text, ".xml"))
+    return documents
+
+
+def random_queries(count, seed=2):
+    """
+    Random queries of one to six terms (some outside the vocabulary), plus a repeated and an unknown term.
+    """
+    rnd = random.Random(seed)
+    queries = [" ".join("t%d" % rnd.randrange(45) for _ in range(rnd.randint(1, 6))) for _ in range(count)]
+    return queries + ["t3 t3 t7", "t44"]
+
+
+def build_models(documents, lsa_components=10):
+    """
+    TF-IDF builder, VSM, BM25 and LM built over the documents, like SearchEngine builds them.
+    VSM refits on every update so its scores can be compared with a full build.
+    """
+    from DocumentAnalyzer import DocumentAnalyzer
+
+    tf_idf, vsm, bm25, lm = empty_models(lsa_components)
+    tf_idf.add_documents(documents)
+    tf_idf.snippets.build(tf_idf.documents)
+    analyses = DocumentAnalyzer(tf_idf.preprocessor).analyze_all(documents)
+    for model in (vsm, bm25, lm):
+        model.build_index(documents, analyses)
+    return tf_idf, vsm, bm25, lm
+
+
+def empty_models(lsa_components=10):
+    """
+    Unbuilt models sharing one TF-IDF builder, e.g. to load a saved index into.
+    """
+    from sklearn.decomposition import TruncatedSVD
+    from BestMatching25 import BM25
+    from LanguageModel import MultinomialLanguageModel
+    from TF_IDF_Builder import TF_IDF_Builder
+    from VectorSpaceModel import VectorSpaceModel
+
+    tf_idf = TF_IDF_Builder(ToyPreprocessor())
+    vsm = VectorSpaceModel(tf_idf, NullRun(), refit_threshold=0)
+    vsm.svd = TruncatedSVD(n_components=lsa_components, random_state=0)  # Toy vocabularies are far below 300 terms
+    return (tf_idf, vsm, BM25(tf_idf, NullRun()),
+            MultinomialLanguageModel(tf_idf, NullRun(), mu=1000, lambda_unk=0.0001, lambda_jm=0.2))
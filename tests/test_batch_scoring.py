@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+try:
+    import TextPreprocessor  # noqa: F401  Loads the spaCy model and NLTK data the models import
+except (ImportError, OSError) as error:
+    pytest.skip("NLP resources unavailable: %s" % error, allow_module_level=True)
+
+from conftest import build_models, make_documents, random_queries  # noqa: E402
+from Query import Query  # noqa: E402
+from ScoreFusion import rank_scores  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def models():
+    # Every document twice, so equal scores (ties) are common
+    documents = make_documents(150, seed=4)
+    documents += make_documents(150, seed=4, first_id=150)
+    return build_models(documents)
+
+
+@pytest.mark.parametrize("model, scoring", [("vsm", ()), ("bm25", ()), ("lm", ("dirichlet",)), ("lm", ("jm",))])
+def test_score_matrix_ranks_like_score_vector(models, model, scoring):
+    """
+    Batch runs rank like the per-query search path; the scores may differ in the last bits.
+    """
+    model = dict(zip(("tfidf", "vsm", "bm25", "lm"), models))[model]
+    texts = random_queries(40)
+    batch = model.score_matrix([Query(query_id, text) for query_id, text in enumerate(texts)], *scoring)
+
+    for query_id, text in enumerate(texts):
+        expected = model.score_vector(Query(query_id, text), *scoring)
+        np.testing.assert_allclose(batch[query_id], expected, rtol=0, atol=1e-13, err_msg=text)
+        assert rank_scores(batch[query_id], 100).tolist() == rank_scores(expected, 100).tolist(), text
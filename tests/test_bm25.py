@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+import pytest
+
+try:
+    import TextPreprocessor  # noqa: F401  Loads the spaCy model and NLTK data the models import
+except (ImportError, OSError) as error:
+    pytest.skip("NLP resources unavailable: %s" % error, allow_module_level=True)
+
+from conftest import build_models, make_documents, random_queries  # noqa: E402
+from Document import Document  # noqa: E402
+from Query import Query  # noqa: E402
+from ScoreFusion import rank_scores  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def bm25():
+    # Every document twice, so equal scores (ties) are common
+    documents = make_documents(150, seed=1)
+    documents += make_documents(150, seed=1, first_id=150)
+    return build_models(documents)[2]
+
+
+@pytest.mark.parametrize("k", [1, 5, 10, 50, 1000])
+def test_top_k_matches_exhaustive_ranking(bm25, k):
+    for query_id, text in enumerate(random_queries(40)):
+        exhaustive = bm25.score_vector(Query(query_id, text))
+        expected = rank_scores(exhaustive, k)
+        results = bm25.search(Query(query_id, text), k)
+
+        assert [result["doc_idx"] for result in results] == expected.tolist(), text
+        assert [result["score"] for result in results] == exhaustive[expected].tolist(), text
+
+
+def textbook_bm25(corpus, query_terms, k1=1.5, b=0.75):
+    """
+    Okapi BM25 of every document, straight from the formula, with the idf
+    log((N - df + 0.5) / (df + 0.5) + 1); a repeated query term counts once per occurrence.
+    """
+    documents = [text.split() for text in corpus]
+    avgdl = sum(len(tokens) for tokens in documents) / len(documents)
+    scores = []
+    for tokens in documents:
+        score = 0.0
+        for term in query_terms:
+            df = sum(term in other for other in documents)
+            if df == 0:
+                continue
+            idf = math.log((len(documents) - df + 0.5) / (df + 0.5) + 1)
+            tf = tokens.count(term)
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokens) / avgdl))
+        scores.append(score)
+    return scores
+
+
+def test_score_vector_matches_textbook_formula():
+    corpus = ["rocket engine thrust",
+              "engine engine cooling fluid",
+              "wing flutter at supersonic speed",
+              "thrust of a supersonic rocket engine nozzle",
+              "boundary layer",
+              "cooling of the nozzle wall by boundary layer fluid injection"]
+    documents = [Document(str(i), "doc%d.xml" % i, "", text, text, ".xml") for i, text in enumerate(corpus)]
+    bm25 = build_models(documents, lsa_components=2)[2]
+    # The model drops stopwords from the documents
+    indexed = [" ".join(word for word in text.split() if word not in bm25.stop_words) for text in corpus]
+
+    for text in ["rocket engine", "engine engine", "cooling nozzle fluid", "boundary", "hypersonic", "thrust wing"]:
+        expected = np.array(textbook_bm25(indexed, text.split()))
+        expected[expected <= 0] = np.nan  # Documents without a match are not retrieved
+
+        np.testing.assert_allclose(bm25.score_vector(Query(1, text)), expected, rtol=1e-12, err_msg=text)
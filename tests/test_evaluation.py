@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, "trec_eval-main", "results_testing")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+TOLERANCE = 5e-5 + 1e-9  # trec_eval prints 4 decimals, rounding ties like 0.03125 down
+
+from Evaluation import Evaluator  # noqa: E402
+
+
+def load_trec_eval_output(path):
+    """
+    Read `trec_eval -q` output into (measure, query id) -> value.
+    """
+    values = {}
+    with open(path, "r") as f:
+        for line in f:
+            measure, query_id, value = line.split()
+            values[(measure, query_id)] = value
+    return values
+
+
+@pytest.fixture(scope="module")
+def evaluator():
+    return Evaluator(os.path.join(RESULTS, "cranqrel.test.txt"))
+
+
+@pytest.mark.parametrize("run_file, output_file", [
+    ("vsm_results.trec", "vsm_out.test"),
+    ("bm25_results.trec", "bm_out.test"),
+    ("lm_results.trec", "lm_out.test"),
+])
+def test_matches_trec_eval(evaluator, run_file, output_file):
+    expected = load_trec_eval_output(os.path.join(RESULTS, output_file))
+    summary, per_query, query_ids = evaluator.evaluate(Evaluator.load_run(os.path.join(RESULTS, run_file)))
+
+    assert summary["num_q"] == int(expected[("num_q", "all")])
+    assert summary["num_rel_ret"] == int(expected[("num_rel_ret", "all")])
+    for measure, values in per_query.items():
+        for query_id, value in zip(query_ids, values):
+            assert value == pytest.approx(float(expected[(measure, query_id)]), abs=TOLERANCE), (measure, query_id)
+        if measure != "num_rel_ret":
+            assert summary[measure] == pytest.approx(float(expected[(measure, "all")]), abs=TOLERANCE), measure
+
+
+def test_vsm_summary(evaluator):
+    summary, _, _ = evaluator.evaluate(Evaluator.load_run(os.path.join(RESULTS, "vsm_results.trec")))
+
+    assert round(summary["map"], 4) == 0.1567
+    assert round(summary["bpref"], 4) == 0.2785
+    assert round(summary["P_10"], 4) == 0.1338
+    assert round(summary["ndcg_cut_10"], 4) == 0.2099
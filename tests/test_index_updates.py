@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+try:
+    import TextPreprocessor  # noqa: F401  Loads the spaCy model and NLTK data the models import
+except (ImportError, OSError) as error:
+    pytest.skip("NLP resources unavailable: %s" % error, allow_module_level=True)
+
+from conftest import build_models, empty_models, make_documents  # noqa: E402
+from DocumentAnalyzer import DocumentAnalyzer  # noqa: E402
+from IndexStore import IndexStore  # noqa: E402
+from Query import Query  # noqa: E402
+
+DOCUMENTS = make_documents(120, seed=3)
+REMOVED = [3, 50, 85, 110]
+QUERIES = ["t1 t2", "t3 t17 t30", "t7", "t11 t11 t2", "t39 t0 t5 t8", "t12 t99"]
+NAMES = ("tfidf", "vsm", "bm25", "lm")
+
+
+def add_documents(models, documents):
+    # Same order as SearchEngine.add_documents
+    tf_idf, vsm, bm25, lm = models
+    analyses = DocumentAnalyzer(tf_idf.preprocessor).analyze_all(documents)
+    tf_idf.add_documents(documents)
+    for model in (vsm, bm25, lm):
+        model.add_documents(documents, analyses)
+
+
+def remove_documents(models, doc_indices):
+    for model in models[1:]:
+        model.remove_documents(doc_indices)
+
+
+def save_and_load(models, index_dir):
+    store = IndexStore(str(index_dir))
+    for name, model in zip(NAMES, models):
+        model.save(store.path(name))
+    loaded = empty_models()
+    for name, model in zip(NAMES, loaded):
+        model.load(store.path(name))
+    return loaded
+
+
+def model_scores(models, text):
+    _, vsm, bm25, lm = models
+    return {
+        "vsm": vsm.score_vector(Query(1, text)),
+        "bm25": bm25.score_vector(Query(1, text)),
+        "bm25_top_k": bm25.score_vector(Query(1, text), k=10),
+        "lm_dirichlet": lm.score_vector(Query(1, text), "dirichlet"),
+        "lm_jm": lm.score_vector(Query(1, text), "jm"),
+        # Batch scoring uses the cached BM25 weight and LM correction matrices
+        "vsm_batch": vsm.score_matrix([Query(1, text)])[0],
+        "bm25_batch": bm25.score_matrix([Query(1, text)])[0],
+        "lm_dirichlet_batch": lm.score_matrix([Query(1, text)], "dirichlet")[0],
+        "lm_jm_batch": lm.score_matrix([Query(1, text)], "jm")[0],
+    }
+
+
+def assert_same_scores(models, reference):
+    """
+    Scores of the updated index equal those of the index built from scratch over the
+    remaining documents (matched by doc id); removed documents are never retrieved.
+    """
+    doc_ids = list(models[0].documents.doc_ids)
+    positions = [doc_ids.index(doc_id) for doc_id in reference[0].documents.doc_ids]
+    removed = [doc_ids.index(str(doc_idx)) for doc_idx in REMOVED]
+    for text in QUERIES:
+        expected = model_scores(reference, text)
+        for name, scores in model_scores(models, text).items():
+            np.testing.assert_allclose(scores[positions], expected[name], rtol=1e-9, atol=1e-12,
+                                       err_msg="%s %r" % (name, text))
+            assert np.isnan(scores[removed]).all(), (name, text)
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return build_models([doc for doc in DOCUMENTS if int(doc.doc_id) not in REMOVED])
+
+
+def test_updates_match_full_build(reference, tmp_path):
+    models = build_models(DOCUMENTS[:80])
+    model_scores(models, QUERIES[0])  # Fills the cached batch matrices, which every update must invalidate
+    add_documents(models, DOCUMENTS[80:100])
+    add_documents(models, DOCUMENTS[100:])
+    model_scores(models, QUERIES[1])
+    remove_documents(models, REMOVED)
+    assert_same_scores(models, reference)
+
+    assert_same_scores(save_and_load(models, tmp_path), reference)
+
+
+def test_updates_after_load_match_full_build(reference, tmp_path):
+    models = save_and_load(build_models(DOCUMENTS[:80]), tmp_path / "built")
+    model_scores(models, QUERIES[0])
+    remove_documents(models, REMOVED[:2])  # Before the loaded postings and token lists are copied
+    model_scores(models, QUERIES[1])
+    add_documents(models, DOCUMENTS[80:])
+    remove_documents(models, REMOVED[2:])
+    assert_same_scores(models, reference)
+
+    assert_same_scores(save_and_load(models, tmp_path / "updated"), reference)